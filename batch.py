@@ -0,0 +1,116 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+import yaml
+from conversation_manager import ConversationManager
+from utils import save_conversation, transcript_path
+from warmup import warm_up, model_placement
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+def load_specs(spec_file):
+    with open(spec_file, 'r') as f:
+        if spec_file.endswith('.jsonl'):
+            specs = [json.loads(line) for line in f if line.strip()]
+        else:
+            specs = yaml.safe_load(f)
+
+    if not isinstance(specs, list):
+        raise ValueError(f"Spec file {spec_file} must contain a list of conversation specs")
+    for i, spec in enumerate(specs):
+        if not isinstance(spec, dict) or not spec.get('topic'):
+            raise ValueError(f"Conversation spec {i + 1} in {spec_file} is missing a topic")
+    logger.info(f"Loaded {len(specs)} conversation specs from {spec_file}")
+    return specs
+
+def normalize_spec(spec, config):
+    profiles = list(spec.get('profiles') or [])
+    num_participants = spec.get('participants', max(len(profiles), 2))
+    profiles = (profiles + [None] * num_participants)[:num_participants]
+    selected_model = spec.get('model', config['available_models'][0])
+    models = spec.get('models')
+    return {
+        "num_participants": num_participants,
+        "selected_model": selected_model,
+        # 'models' assigns one model per participant, cycling if the list is shorter
+        "participant_models": [models[i % len(models)] for i in range(num_participants)] if models else None,
+        "topic": spec['topic'],
+        "profiles": profiles,
+        "num_rounds": spec.get('rounds', 3),
+    }
+
+async def run_spec(index, spec, config, semaphore, batch_id):
+    filename_base = f"convo_{batch_id}_{index + 1:04d}"
+    async with semaphore:
+        manager = ConversationManager(config, interactive=False, transcript_path=transcript_path(config['save_path'], filename_base),
+                                      conversation_id=filename_base, **normalize_spec(spec, config))
+        logger.info(f"Starting conversation {index + 1}: {spec['topic']}")
+        history = await manager.run_conversation_async()
+
+    # A conversation that crashed is saved as far as it got, and counted as failed
+    save_conversation(history, config['save_path'], filename_base)
+    if manager.error is not None:
+        raise RuntimeError(f"Conversation stopped after {manager.conversation_history.turns} turns: "
+                           f"{manager.error}") from manager.error
+    # Only what the summary needs is kept, so finished conversations can be freed while the batch runs
+    return {"totals": manager.turn_totals, "failed_turns": manager.failed_turns, "savings": manager.savings()}
+
+async def run_batch_async(config, specs, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    batch_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    start_time = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_spec(i, spec, config, semaphore, batch_id) for i, spec in enumerate(specs)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start_time
+
+    finished = []
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            logger.error(f"Conversation {i + 1} failed: {result}")
+        else:
+            finished.append(result)
+    return summarize_batch(finished, len(specs), elapsed)
+
+def summarize_batch(results, total, elapsed):
+    totals = [result['totals'] for result in results]
+    eval_tokens = sum(total.eval_count for total in totals)
+    generation_time = sum(total.duration for total in totals)
+    prompt_eval_time = sum(total.prompt_eval_duration for total in totals)
+    summary = {
+        "conversations": len(results),
+        "failed": total - len(results),
+        "turns": sum(total.turns for total in totals),
+        "failed_turns": sum(result['failed_turns'] for result in results),
+        "elapsed": elapsed,
+        "conversations_per_min": len(results) / elapsed * 60 if elapsed > 0 else 0.0,
+        "eval_tokens": eval_tokens,
+        # Aggregate throughput across all in-flight conversations
+        "tokens_per_sec": eval_tokens / elapsed if elapsed > 0 else 0.0,
+        # Average speed of a single generation
+        "tokens_per_sec_per_turn": eval_tokens / generation_time if generation_time > 0 else 0.0,
+        "prompt_eval_tokens": sum(total.prompt_eval_count for total in totals),
+        "prompt_eval_time": prompt_eval_time,
+        # Generation avoided by the turn_length settings, summed over conversations
+        "savings": {key: sum(result['savings'][key] for result in results)
+                    for key in ("cut_turns", "skipped_turns", "convergence_checks", "tokens_saved", "time_saved")},
+    }
+    logger.info(f"Batch summary: {summary}")
+    return summary
+
+def run_batch(config, spec_file, concurrency=None):
+    specs = load_specs(spec_file)
+    concurrency = concurrency or config.get('batch_concurrency', 4)
+    conversations = []
+    for spec in specs:
+        spec = normalize_spec(spec, config)
+        conversations.append(spec['participant_models'] or [spec['selected_model']] * spec['num_participants'])
+    warmup = warm_up(config, model_placement(config, conversations))
+    logger.info(f"Running {len(specs)} conversations with up to {concurrency} in flight")
+    summary = asyncio.run(run_batch_async(config, specs, concurrency))
+    summary['warmup'] = warmup
+    return summary
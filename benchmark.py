@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from conversation_manager import ConversationManager
+from ollama_clients import configure_clients
+from log_config import queue_handlers
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+def start_mock_server(args):
+    # The stub runs in its own process so its CPU time is not counted as client overhead
+    process = subprocess.Popen(
+        [sys.executable, "mock_ollama.py", "--port", "0",
+         "--latency", str(args.latency),
+         "--tokens-per-sec", str(args.tokens_per_sec),
+         "--prompt-tokens-per-sec", str(args.prompt_tokens_per_sec)],
+        stdout=subprocess.PIPE, text=True
+    )
+    url = process.stdout.readline().strip()
+    if not url:
+        process.kill()
+        raise RuntimeError("Mock Ollama server did not start")
+    return process, url
+
+def import_time_ms(module):
+    # Cumulative import time of a module in a fresh interpreter, as reported by python -X importtime
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    for line in reversed(result.stderr.splitlines()):
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module and not fields[2].startswith("  "):
+            return int(fields[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+def measure_startup(modules, runs):
+    # The best of several runs, so a cold disk cache does not count against the budget
+    results = []
+    for module in modules:
+        import_ms = min(import_time_ms(module) for _ in range(runs))
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+        results.append({"module": module, "import_ms": import_ms,
+                        "process_ms": (time.perf_counter() - start_time) * 1000})
+    return results
+
+def print_startup(results):
+    print(f"{'module':<22} {'import ms':>9} {'process ms':>10}")
+    for row in results:
+        print(f"{row['module']:<22} {row['import_ms']:>9.1f} {row['process_ms']:>10.1f}")
+
+def configure_logging(mode, level, directory):
+    # 'off' only lets warnings through, 'sync' writes every record to a file on the conversation's thread,
+    # and 'queued' hands records to a listener thread, as setup_logging does
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    if mode == "off":
+        root.setLevel(logging.WARNING)
+        return lambda: None
+    root.setLevel(level)
+    file_handler = logging.FileHandler(os.path.join(directory, f"{mode}.log"))
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    if mode == "sync":
+        root.addHandler(file_handler)
+        return file_handler.close
+    handler, listener = queue_handlers([file_handler])
+    root.addHandler(handler)
+
+    def stop():
+        listener.stop()
+        file_handler.close()
+    return stop
+
+def parse_limit(value):
+    return None if value.lower() in ("none", "null", "full") else int(value)
+
+def benchmark_config(args, host, history_limit, prompt_layout, scheduler):
+    return {
+        "moderator_model": args.model,
+        "ollama_host": host,
+        "save_path": "",
+        "available_models": [args.model],
+        "history_limit": history_limit,
+        "prompt_layout": prompt_layout,
+        "scheduler": scheduler,
+        "options": {"num_predict": args.num_predict},
+    }
+
+def run_case(config, model, participants, rounds):
+    manager = ConversationManager(config, participants, model, "Benchmark conversation",
+                                  [f"Benchmark participant {i + 1}" for i in range(participants)], rounds,
+                                  interactive=False)
+    tracemalloc.start()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    asyncio.run(manager.run_conversation_async())
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Percentiles cover the turns whose stats are still resident, the totals cover every turn
+    latencies = [stats['duration'] for stats in manager.turn_stats]
+    totals = manager.turn_totals
+    turns = totals.turns or 1
+    return {
+        "turns": totals.turns,
+        "wall_time": wall_time,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99),
+        "cpu_ms_per_turn": cpu_time / turns * 1000,
+        "peak_memory_kb": peak_memory / 1024,
+        "prompt_eval_tokens": totals.prompt_eval_count,
+        "prompt_eval_time": totals.prompt_eval_duration,
+    }
+
+def print_results(results):
+    header = (f"{'parts':>5} {'rounds':>6} {'limit':>5} {'layout':>7} {'sched':>10} {'log':>6} {'turns':>5} {'wall s':>7} "
+              f"{'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7} {'cpu ms/turn':>11} {'peak KiB':>9} {'prompt tok':>10} {'prompt s':>8}")
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(f"{row['participants']:>5} {row['rounds']:>6} {str(row['history_limit']):>5} {row['prompt_layout']:>7} "
+              f"{row['scheduler']:>10} {row['log_mode']:>6} {row['turns']:>5} {row['wall_time']:>7.2f} "
+              f"{row['p50'] * 1000:>7.1f} {row['p90'] * 1000:>7.1f} {row['p99'] * 1000:>7.1f} "
+              f"{row['cpu_ms_per_turn']:>11.2f} {row['peak_memory_kb']:>9.0f} "
+              f"{row['prompt_eval_tokens']:>10} {row['prompt_eval_time']:>8.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ConversationManager against a mock Ollama server")
+    parser.add_argument("--participants", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[3, 10])
+    parser.add_argument("--history-limit", type=parse_limit, nargs="+", default=[None, 3],
+                        help="Rounds of history to keep; 'none' keeps the full history")
+    parser.add_argument("--prompt-layout", nargs="+", default=["sliding"], choices=["sliding", "stable"])
+    parser.add_argument("--scheduler", nargs="+", default=["sequential"], choices=["sequential", "pipelined", "parallel"])
+    parser.add_argument("--log-mode", nargs="+", default=["off"], choices=["off", "sync", "queued"],
+                        help="Logging during the run: none, written on the conversation's thread, or via a queue")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO"])
+    parser.add_argument("--model", default="mock-model")
+    parser.add_argument("--num-predict", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock server latency per request in seconds")
+    parser.add_argument("--tokens-per-sec", type=float, default=2000.0)
+    parser.add_argument("--prompt-tokens-per-sec", type=float, default=20000.0)
+    parser.add_argument("--host", help="Benchmark an existing server instead of starting the mock")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--max-cpu-ms-per-turn", type=float,
+                        help="Exit with an error if any case exceeds this client CPU time per turn")
+    parser.add_argument("--startup", action="store_true",
+                        help="Measure module import times instead of running conversations")
+    parser.add_argument("--startup-modules", nargs="+", default=["main", "batch", "conversation_manager", "cli"])
+    parser.add_argument("--max-import-ms", type=float,
+                        help="With --startup, exit with an error if importing any module takes longer than this")
+    args = parser.parse_args()
+
+    if args.startup:
+        results = measure_startup(args.startup_modules, runs=5)
+        print_startup(results)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+        if args.max_import_ms is not None:
+            slow = [row['module'] for row in results if row['import_ms'] > args.max_import_ms]
+            if slow:
+                print(f"Import of {', '.join(slow)} exceeded {args.max_import_ms} ms", file=sys.stderr)
+                sys.exit(1)
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+    configure_clients({})
+
+    process = None
+    host = args.host
+    if host is None:
+        process, host = start_mock_server(args)
+    log_dir = tempfile.TemporaryDirectory()
+    try:
+        results = []
+        for participants, rounds, history_limit, prompt_layout, scheduler, log_mode in itertools.product(
+                args.participants, args.rounds, args.history_limit, args.prompt_layout, args.scheduler, args.log_mode):
+            config = benchmark_config(args, host, history_limit, prompt_layout, scheduler)
+            stop_logging = configure_logging(log_mode, getattr(logging, args.log_level), log_dir.name)
+            try:
+                result = run_case(config, args.model, participants, rounds)
+            finally:
+                stop_logging()
+            result.update(participants=participants, rounds=rounds, history_limit=history_limit,
+                          prompt_layout=prompt_layout, scheduler=scheduler, log_mode=log_mode)
+            results.append(result)
+    finally:
+        log_dir.cleanup()
+        if process:
+            process.terminate()
+            process.wait()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.max_cpu_ms_per_turn is not None:
+        slow = [row for row in results if row['cpu_ms_per_turn'] > args.max_cpu_ms_per_turn]
+        if slow:
+            print(f"{len(slow)} case(s) exceeded {args.max_cpu_ms_per_turn} ms of client CPU per turn", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
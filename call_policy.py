@@ -0,0 +1,226 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+# HTTP statuses that mean the server is overloaded or restarting rather than that the request is bad
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    pass
+
+def is_retryable(error):
+    import httpx
+    import ollama
+    # The exception chain is followed because the async streaming client can hide an HTTP error
+    # behind one raised while reading the error body
+    for _ in range(5):
+        if error is None:
+            break
+        if isinstance(error, (asyncio.TimeoutError, ConnectionError, httpx.TransportError)):
+            return True
+        if isinstance(error, ollama.ResponseError):
+            return error.status_code in RETRYABLE_STATUS
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRYABLE_STATUS
+        error = error.__cause__ or error.__context__
+    return False
+
+class CircuitBreaker:
+    # Opens after failure_threshold consecutive failures; once reset_timeout has passed a single probe
+    # request is let through, and its result decides whether the circuit closes again
+    def __init__(self, host, failure_threshold, reset_timeout):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit for {self.host} closed again")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def release_probe(self):
+        # A probe that was cancelled proves nothing either way; the next request may probe instead
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit for {self.host} opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+class CallPolicy:
+    # Shared rules for every Ollama request: a per-request timeout, a few retries with exponential backoff
+    # and full jitter for transient failures, a per-host concurrency limit, and a circuit breaker per host
+    def __init__(self, timeout=None, max_attempts=3, backoff_base=0.5, backoff_max=8.0,
+                 failure_threshold=5, reset_timeout=30.0, max_concurrency=None):
+        self.timeout = timeout
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_concurrency = max_concurrency
+        self.breakers = {}
+        self.lock = threading.Lock()
+        self.thread_limits = {}
+        # asyncio semaphores belong to the event loop they are first used on
+        self.async_limits = weakref.WeakKeyDictionary()
+
+    def backoff(self, attempt):
+        # Full jitter keeps callers that failed together from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def breaker(self, host):
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    @contextmanager
+    def limit(self, host):
+        if self.max_concurrency is None:
+            yield
+            return
+        with self.lock:
+            semaphore = self.thread_limits.setdefault(host, threading.BoundedSemaphore(self.max_concurrency))
+        with semaphore:
+            yield
+
+    @asynccontextmanager
+    async def limit_async(self, host):
+        if self.max_concurrency is None:
+            yield
+            return
+        limits = self.async_limits.setdefault(asyncio.get_running_loop(), {})
+        semaphore = limits.setdefault(host, asyncio.Semaphore(self.max_concurrency))
+        async with semaphore:
+            yield
+
+    def before_attempt(self, host):
+        if not self.breaker(host).allow():
+            raise CircuitOpenError(f"Not sending requests to {host} after repeated failures")
+
+    def after_failure(self, host, error, attempt, description):
+        # Returns the delay before the next attempt, or None if the error should be raised
+        if not is_retryable(error):
+            # The host answered, it just rejected this request
+            self.breaker(host).record_success()
+            return None
+        self.breaker(host).record_failure()
+        if attempt + 1 >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt)
+        logger.warning(f"{description} failed on {host} ({type(error).__name__}: {error}); "
+                       f"retrying in {delay:.2f}s (attempt {attempt + 2} of {self.max_attempts})")
+        return delay
+
+    def call(self, host, request, description="Request"):
+        # request is called again for every attempt. Synchronous clients enforce the timeout themselves,
+        # through the client.timeout setting
+        for attempt in range(self.max_attempts):
+            self.before_attempt(host)
+            try:
+                with self.limit(host):
+                    result = request()
+            except Exception as e:
+                delay = self.after_failure(host, e, attempt, description)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+            else:
+                self.breaker(host).record_success()
+                return result
+
+    async def call_async(self, host, request, description="Request"):
+        # request is a coroutine function, called again for every attempt
+        for attempt in range(self.max_attempts):
+            self.before_attempt(host)
+            try:
+                async with self.limit_async(host):
+                    result = await asyncio.wait_for(request(), self.timeout)
+            except asyncio.CancelledError:
+                self.breaker(host).release_probe()
+                raise
+            except Exception as e:
+                delay = self.after_failure(host, e, attempt, description)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            else:
+                self.breaker(host).record_success()
+                return result
+
+    async def stream_async(self, host, request, description="Request"):
+        # request is a coroutine function returning an async iterator of chunks. A stream is retried only until
+        # its first chunk; once output has been passed on, a failure is final. The time between chunks is
+        # bounded by the client's read timeout rather than by self.timeout
+        for attempt in range(self.max_attempts):
+            self.before_attempt(host)
+            started = False
+            try:
+                async with self.limit_async(host):
+                    response_stream = await asyncio.wait_for(request(), self.timeout)
+                    try:
+                        async for chunk in response_stream:
+                            started = True
+                            yield chunk
+                    finally:
+                        # A reader that stops early closes the HTTP response now rather than when it is collected
+                        await response_stream.aclose()
+            except GeneratorExit:
+                # The reader stopped early, e.g. at its sentence limit; the host answered, so this is a success
+                self.breaker(host).record_success()
+                raise
+            except asyncio.CancelledError:
+                self.breaker(host).release_probe()
+                raise
+            except Exception as e:
+                delay = None if started else self.after_failure(host, e, attempt, description)
+                if delay is None:
+                    if started and is_retryable(e):
+                        self.breaker(host).record_failure()
+                    raise
+                await asyncio.sleep(delay)
+            else:
+                self.breaker(host).record_success()
+                return
+
+_policy = CallPolicy()
+
+def configure_policy(config):
+    global _policy
+    settings = config.get('call_policy') or {}
+    _policy = CallPolicy(**settings)
+    logger.info(f"Configured call policy: {settings}")
+    return _policy
+
+def get_policy():
+    return _policy
@@ -1,11 +1,9 @@
-import os
 from rich.console import Console
 from rich.panel import Panel
+from rich.live import Live
 from rich.prompt import Prompt, IntPrompt, Confirm
 from rich.text import Text
 from rich import print as rprint
-from questionary import Choice
-import questionary
 import logging
 
 # Configure logging
@@ -13,8 +11,13 @@ logger = logging.getLogger(__name__)
 
 console = Console()
 
+MIXED_MODELS = 'mixed'
+
+# questionary is imported inside the prompts that use it; it is slow to import and headless runs never prompt
+
 def clear_screen():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    # Clear with escape codes instead of spawning a 'clear' subprocess
+    console.clear()
 
 def print_header(text):
     clear_screen()
@@ -39,13 +42,20 @@ def get_user_preferences(moderator, config):
     )
     console.print()
 
-    model = get_model_preference(config['available_models'])
+    model = get_model_preference(config['available_models'], allow_mixed=True)
     console.print()
 
-    topic = get_topic_preference(moderator)
+    participant_models = None
+    if model == MIXED_MODELS:
+        participant_models = [get_model_preference(config['available_models'], f"Choose the LLM model for Participant {i + 1}:")
+                              for i in range(num_participants)]
+        model = participant_models[0]
+        console.print()
+
+    topic = get_topic_preference(moderator, config.get('topic_candidates', 3))
     console.print()
     
-    profiles = [get_profile_preference(i + 1, moderator, topic) for i in range(num_participants)]
+    profiles = get_profile_preferences(num_participants, moderator, topic)
     console.print()
     
     num_rounds = get_valid_input(
@@ -57,24 +67,29 @@ def get_user_preferences(moderator, config):
     )
     console.print()
     
-    return num_participants, model, topic, profiles, num_rounds
+    return num_participants, model, topic, profiles, num_rounds, participant_models
 
-def get_model_preference(available_models):
-    console.print("Choose the LLM model for the conversation:")
+def get_model_preference(available_models, prompt="Choose the LLM model for the conversation:", allow_mixed=False):
+    import questionary
+    console.print(prompt)
+    choices = list(available_models)
+    if allow_mixed and len(available_models) > 1:
+        choices.append(questionary.Choice("A different model for each participant", MIXED_MODELS))
     model = questionary.select(
         "",
-        choices=available_models,
+        choices=choices,
         style=questionary.Style([('selection', 'cyan')])
     ).ask()
     return model
 
-def get_topic_preference(moderator):
+def get_topic_preference(moderator, candidates=3):
+    import questionary
     console.print("How would you like to determine the conversation topic?")
     choice = questionary.select(
         "",
         choices=[
-            Choice("I'll provide the topic myself", 'manual'),
-            Choice("Have the moderator generate it", 'generated')
+            questionary.Choice("I'll provide the topic myself", 'manual'),
+            questionary.Choice("Have the moderator generate it", 'generated')
         ],
         style=questionary.Style([('selection', 'cyan')])
     ).ask()
@@ -86,62 +101,124 @@ def get_topic_preference(moderator):
         while True:
             keywords = Prompt.ask("Enter keywords for topic generation (comma-separated)")
             keywords = [k.strip() for k in keywords.split(',')]
+            # Several candidates are generated at once, so rejecting one costs no extra round trip
             with console.status("[bold green]Generating topic...", spinner="dots"):
-                topic = moderator.generate_topic(keywords)
-            console.print(f"\nGenerated topic: [bold cyan]{topic}[/bold cyan]")
-            if Confirm.ask("Do you approve this topic?"):
-                return topic
-            logger.info("User rejected the generated topic. Generating a new one.")
+                topics = [topic for topic in moderator.generate_topics(keywords, max(candidates, 1)) if topic]
+            if not topics:
+                console.print("[bold red]The moderator could not generate a topic.[/bold red]")
+                return Prompt.ask("Please enter the conversation topic")
+            for topic in topics:
+                console.print(f"\nGenerated topic: [bold cyan]{topic}[/bold cyan]")
+                if Confirm.ask("Do you approve this topic?"):
+                    return topic
+                logger.info("User rejected the generated topic. Trying the next candidate.")
+
+def get_profile_preferences(num_participants, moderator, topic):
+    profiles = {}
+    pending = []
+    for participant_num in range(1, num_participants + 1):
+        choice = get_profile_choice(participant_num)
+        if choice == 'manual':
+            profiles[participant_num] = Prompt.ask(f"Enter profile for Participant {participant_num}")
+            console.print()
+        elif choice == 'generated':
+            pending.append(participant_num)
+        else:
+            profiles[participant_num] = None
+
+    # All requested profiles are generated in one concurrent pass; rejected ones go round again together
+    while pending:
+        with console.status(f"[bold green]Generating {len(pending)} profile(s)...", spinner="dots"):
+            generated = moderator.generate_profiles(topic, pending)
+        rejected = []
+        for participant_num, profile in zip(pending, generated):
+            if profile is None:
+                console.print(f"\n[bold red]The moderator could not generate a profile for Participant {participant_num}.[/bold red]")
+                profiles[participant_num] = Prompt.ask(f"Enter profile for Participant {participant_num}")
+                continue
+            console.print(f"\nGenerated profile for Participant {participant_num}: [bold cyan]{profile}[/bold cyan]")
+            if Confirm.ask("Do you approve this profile?"):
+                profiles[participant_num] = profile
+            else:
+                logger.info(f"User rejected the generated profile for Participant {participant_num}. Generating a new one.")
+                rejected.append(participant_num)
+        pending = rejected
 
-def get_profile_preference(participant_num, moderator, topic):
+    return [profiles[participant_num] for participant_num in range(1, num_participants + 1)]
+
+def get_profile_choice(participant_num):
+    import questionary
     console.print(f"How would you like to determine Participant {participant_num}'s profile?")
     choice = questionary.select(
         "",
         choices=[
-            Choice("I'll provide the profile myself", 'manual'),
-            Choice("Have the moderator generate it", 'generated'),
-            Choice("No profile", 'none')
+            questionary.Choice("I'll provide the profile myself", 'manual'),
+            questionary.Choice("Have the moderator generate it", 'generated'),
+            questionary.Choice("No profile", 'none')
         ],
         style=questionary.Style([('selection', 'cyan')])
     ).ask()
     console.print()
-    
-    if choice == 'manual':
-        return Prompt.ask(f"Enter profile for Participant {participant_num}")
-    elif choice == 'generated':
-        while True:
-            with console.status(f"[bold green]Generating profile for Participant {participant_num}...", spinner="dots"):
-                profile = moderator.generate_profile(topic, participant_num)
-            console.print(f"\nGenerated profile: [bold cyan]{profile}[/bold cyan]")
-            if Confirm.ask("Do you approve this profile?"):
-                return profile
-            logger.info(f"User rejected the generated profile for Participant {participant_num}. Generating a new one.")
-    else:
-        return None
+    return choice
 
-def display_conversation(conversation_history):
+def display_conversation(conversation_history, scrollback=None):
+    # Full render, used once at startup; later turns are appended with display_message
     clear_screen()
-    for entry in conversation_history:
-        if entry['role'] == 'system':
-            if entry['content'].startswith("Topic:"):
-                console.print(Panel(entry['content'], expand=False, border_style="yellow", padding=(1, 1)))
-            else:
-                console.print(Panel(entry['content'], expand=False, border_style="yellow", padding=(1, 1)))
-        else:
-            title = Text(entry['role'], style="bold")
-            content = entry['content']
-            # Remove any potential "Participant X: " prefix if it exists
-            if content.startswith(entry['role'] + ":"):
-                content = content[len(entry['role'] + ":"):].strip()
-            console.print(Panel(
-                content,
-                expand=False,
-                border_style="cyan",
-                padding=(1, 1),
-                title=title,
-                title_align="left"
-            ))
+    # Only the turns that are drawn are read, so a long history stays on disk
+    entries = conversation_history.tail(scrollback)
+    hidden = conversation_history.turns - (len(entries) - len(conversation_history.system_entries))
+    if hidden:
+        console.print(f"[dim]... {hidden} earlier messages not shown ...[/dim]")
         console.print()
+    for entry in entries:
+        display_message(entry)
+
+def display_message(entry):
+    console.print(message_panel(entry))
+    console.print()
+
+async def display_live_response_async(name, token_stream):
+    # Only the current speaker's panel is redrawn while tokens arrive
+    content = ""
+    with Live(message_panel({"role": name, "content": Text(f"{name} is thinking...", style="dim")}),
+              console=console, refresh_per_second=12) as live:
+        async for token in token_stream:
+            content += token
+            live.update(message_panel({"role": name, "content": content}))
+    console.print()
+    return content
+
+def display_warmup(warmup):
+    for load in warmup['loads']:
+        if load['error']:
+            console.print(f"[bold red]Could not load {load['model']} on {load['host']}:[/bold red] {load['error']}")
+        else:
+            console.print(f"Loaded [bold]{load['model']}[/bold] on {load['host']} in {load['load_time']:.1f}s")
+    for host, models in warmup['evicted'].items():
+        console.print(f"[bold yellow]Not enough room on {host} to keep {', '.join(models)} loaded with the other models;"
+                      f" expect slow turns while Ollama swaps them.[/bold yellow]")
+    console.print()
+
+def message_panel(entry):
+    if entry['role'] == 'system':
+        return Panel(entry['content'], expand=False, border_style="yellow", padding=(1, 1))
+
+    title = Text(entry['role'], style="bold")
+    if entry.get('status') == 'failed':
+        return Panel(Text(f"No reply: {entry.get('error')}", style="dim"), expand=False, border_style="red",
+                     padding=(1, 1), title=title, title_align="left")
+    content = entry['content']
+    # Remove any potential "Participant X: " prefix if it exists
+    if isinstance(content, str) and content.startswith(entry['role'] + ":"):
+        content = content[len(entry['role'] + ":"):].strip()
+    return Panel(
+        content,
+        expand=False,
+        border_style="cyan",
+        padding=(1, 1),
+        title=title,
+        title_align="left"
+    )
 
 def get_valid_input(prompt_func, prompt, default, validator, error_message):
     while True:
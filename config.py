@@ -27,6 +27,10 @@ def validate_config(config: Dict[str, Any]):
             logger.error(f"Missing required configuration key: {key}")
             raise ValueError(f"Missing required configuration key: {key}")
     
+    if 'ollama_hosts' in config and not (isinstance(config['ollama_hosts'], list) and config['ollama_hosts']):
+        logger.error("ollama_hosts must be a non-empty list")
+        raise ValueError("ollama_hosts must be a non-empty list")
+
     if not isinstance(config['save_path'], str):
         logger.error("save_path must be a string")
         raise ValueError("save_path must be a string")
@@ -1,29 +1,125 @@
-from participant import Participant
+from participant import AsyncParticipant
 from moderator import Moderator
-from cli import display_conversation, clear_screen
-from utils import animate_thinking
-import threading
+from ollama_clients import get_chat_kwargs, get_hosts, load_aware_routing
+from router import get_router
+from history import HistoryWindow
+from history_store import HistoryStore
+from tokens import get_tokenizer, get_token_budget
+from transcript import TranscriptWriter, load_transcript
+from log_config import Truncated
+from datetime import datetime
+from utils import animate_thinking_async
+import asyncio
+import time
+from collections import deque
 import logging
+import metrics
+
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+METRIC_FIELDS = [field for field in metrics.FIELDS if field not in ('timestamp', 'kind', 'conversation')]
+
 class ConversationManager:
-    def __init__(self, config, num_participants, selected_model, topic, profiles, num_rounds):
+    def __init__(self, config, num_participants, selected_model, topic, profiles, num_rounds, interactive=True, moderator=None,
+                 transcript_path=None, resume_entries=None, conversation_id=None, participant_models=None):
         self.config = config
+        # Tag for metrics, so concurrent conversations can be told apart
+        self.conversation_id = conversation_id
+        self.interactive = interactive
         self.num_participants = num_participants
         self.selected_model = selected_model
+        # Optional per-participant models for mixed-model debates
+        self.participant_models = participant_models or [selected_model] * num_participants
         self.topic = topic
         self.profiles = profiles
         self.num_rounds = num_rounds
-        self.participants = self.create_participants()
-        self.conversation_history = self.initialize_conversation_history()
-        self.moderator = Moderator(config['moderator_model'], config['ollama_host'])
-        self.thinking = False
-        self.stop_event = threading.Event()
+        self.hosts = get_hosts(config)
+        self.router = get_router(self.hosts, config) if load_aware_routing(config) else None
         self.history_limit = self.parse_history_limit(config.get('history_limit'))
+        self.max_history_messages = self.history_limit * num_participants if self.history_limit else None
+        # The 'stable' layout keeps the prompt prefix unchanged between turns so Ollama can reuse its cache
+        self.stable_prompt = config.get('prompt_layout', 'sliding') == 'stable'
+        self.history_block_size = config.get('history_block_rounds', 1) * num_participants if self.stable_prompt else 1
+        self.chat_kwargs = get_chat_kwargs(config)
+        self.token_budget = get_token_budget(config)
+        # Participant replies are bounded by max_tokens through num_predict, and cut off client-side after
+        # max_sentences; the moderator keeps the configured options for its longer summaries
+        turn_length = config.get('turn_length') or {}
+        self.participant_kwargs = self.chat_kwargs
+        if turn_length.get('max_tokens'):
+            options = dict(self.chat_kwargs.get('options') or {}, num_predict=turn_length['max_tokens'])
+            self.participant_kwargs = dict(self.chat_kwargs, options=options)
+        self.max_sentences = turn_length.get('max_sentences') or None
+        self.convergence_check = turn_length.get('convergence_check', False)
+        self.min_rounds = turn_length.get('min_rounds', 2)
+        # Rolling summary of messages that fell out of the window, refreshed every summary_interval turns
+        self.summary_interval = config.get('summary_interval', 0)
+        self.summary = None
+        self.summary_task = None
+        self.evicted_entries = []
+        self.history_window = HistoryWindow(self.max_history_messages, self.history_block_size,
+                                            self.token_budget, get_tokenizer(selected_model),
+                                            self.evicted_entries.extend if self.summary_interval else None)
+        # The window only needs its own copy of the entries when it actually drops some
+        self.windowed = self.max_history_messages is not None or self.token_budget is not None
+        self.participants = self.create_participants()
+        self.transcript = TranscriptWriter(transcript_path, self.transcript_metadata(), config.get('transcript_fsync', False)) \
+            if transcript_path else None
+        # Only the latest turns stay in memory; older ones are read back from the transcript when exported
+        self.conversation_history = HistoryStore(config.get('history_resident_turns', 200), transcript_path)
+        if resume_entries:
+            # Replay a partial transcript; it is already on disk so nothing is written again
+            for entry in resume_entries:
+                self.record_entry(entry, persist=False)
+        else:
+            self.initialize_conversation_history()
+        self.completed_turns = self.conversation_history.turns
+        # A resumed conversation that the moderator already ended stays ended
+        self.converged = any(entry.get('status') == 'converged' for entry in self.conversation_history.system_entries)
+        self.moderator = moderator or Moderator(config['moderator_model'], config['ollama_host'], self.chat_kwargs)
+        # Headless runs never render, so there is nothing to stream into
+        self.stream = interactive and config.get('stream', False)
+        self.scrollback = config.get('scrollback', 50)
+        # Totals over every turn, plus the stats of the same recent turns the history keeps resident
+        self.turn_totals = metrics.TurnTotals()
+        self.turn_stats = deque(maxlen=config.get('history_resident_turns', 200))
+        self.failed_turns = 0
+        # 'sequential', 'pipelined' or 'parallel' (all participants answer each round concurrently)
+        self.scheduler = config.get('scheduler', 'sequential')
+        self.round_durations = []
+        # The exception that ended the run early, if any; the history up to that point is still returned
+        self.error = None
+        # Estimated generation avoided by ending the conversation early, net of the convergence checks
+        self.skipped_turns = 0
+        self.skipped_tokens = 0
+        self.skipped_time = 0.0
+        self.convergence_checks = 0
+        self.check_time = 0.0
         logger.info(f"Initialized ConversationManager with {num_participants} participants and {num_rounds} rounds")
 
+    @classmethod
+    def from_transcript(cls, config, path, **kwargs):
+        # Continue a conversation from the last completed turn in its JSONL transcript
+        metadata, entries = load_transcript(path)
+        manager = cls(config, metadata['num_participants'], metadata['model'], metadata['topic'], metadata['profiles'],
+                      metadata['num_rounds'], transcript_path=path, resume_entries=entries,
+                      participant_models=metadata.get('participant_models'), **kwargs)
+        logger.info(f"Resuming conversation from {path} after {manager.completed_turns} completed turns")
+        return manager
+
+    def transcript_metadata(self):
+        return {
+            "topic": self.topic,
+            "profiles": self.profiles,
+            "model": self.selected_model,
+            "participant_models": self.participant_models,
+            "num_participants": self.num_participants,
+            "num_rounds": self.num_rounds,
+            "created": datetime.now().isoformat(timespec='seconds'),
+        }
+
     def parse_history_limit(self, limit):
         if limit is None:
             return None
@@ -34,84 +130,293 @@ class ConversationManager:
             return None
 
     def create_participants(self):
-        participants = [Participant(self.selected_model, self.profiles[i], self.topic, f"Participant {i+1}", self.config['ollama_host']) 
+        # Without a router, participants are spread round-robin over the configured hosts
+        participants = [AsyncParticipant(self.participant_models[i], self.profiles[i], self.topic, f"Participant {i+1}", self.hosts[i % len(self.hosts)],
+                                 self.max_history_messages, self.history_block_size, self.stable_prompt, self.participant_kwargs,
+                                 self.token_budget, self.max_sentences, router=self.router)
                 for i in range(self.num_participants)]
         logger.info(f"Created {len(participants)} participants")
         return participants
 
     def initialize_conversation_history(self):
-        history = [{"role": "system", "content": f"Topic: {self.topic}"}]
+        self.record_entry({"role": "system", "content": f"Topic: {self.topic}"})
         for i, profile in enumerate(self.profiles):
             if profile:
-                history.append({"role": "system", "content": f"Participant {i+1} profile: {profile}"})
-        logger.debug(f"Initialized conversation history: {history}")
-        return history
+                self.record_entry({"role": "system", "content": f"Participant {i+1} profile: {profile}"})
+        logger.debug("Initialized conversation history: %s", Truncated(self.conversation_history.system_entries))
+        return self.conversation_history
+
+    def record_entry(self, entry, persist=True):
+        # Every view of the transcript is updated as the entry is added, so no turn rescans the history
+        if persist and self.transcript:
+            self.transcript.write(entry)
+        self.conversation_history.append(entry)
+        if self.windowed and entry.get('status') != 'failed':
+            self.history_window.append(entry, system=entry['role'] == 'system')
+        for participant in self.participants:
+            participant.observe(entry)
 
     def get_limited_history(self):
-        if self.history_limit is None:
-            return self.conversation_history
+        if not self.windowed:
+            return list(self.conversation_history)
+        return list(self.history_window)
 
-        # Separate system messages and participant messages
-        system_messages = [msg for msg in self.conversation_history if msg['role'] == 'system']
-        participant_messages = [msg for msg in self.conversation_history if msg['role'] != 'system']
-        
-        # Calculate the number of participant messages to keep
-        messages_to_keep = self.history_limit * self.num_participants
+    def run_conversation(self):
+        # Synchronous entry point; the conversation itself runs on an asyncio event loop
+        try:
+            return asyncio.run(self.run_conversation_async())
+        except KeyboardInterrupt:
+            logger.warning("Conversation interrupted by user.")
+            return self.conversation_history
 
-        # Get the most recent participant messages
-        limited_participant_messages = participant_messages[-messages_to_keep:] if messages_to_keep < len(participant_messages) else participant_messages
+    async def run_conversation_async(self):
+        try:
+            if self.router and not self.router.last_refresh:
+                await self.router.refresh_loaded_models()
 
-        return system_messages + limited_participant_messages
+            if self.interactive:
+                # The rich-based display is only loaded for interactive runs, keeping headless startup light
+                from cli import display_conversation
+                display_conversation(self.conversation_history, self.scrollback)
 
-    def run_conversation(self):
-        try:
-            clear_screen()
-            display_conversation(self.conversation_history)
-            
-            for round_num in range(self.num_rounds):
-                logger.info(f"Starting round {round_num + 1}")
-                for participant in self.participants:
-                    is_final_round = (round_num == self.num_rounds - 1)
-                    
-                    self.thinking = True
-                    animation_thread = threading.Thread(target=animate_thinking, args=(participant.name, self.stop_event))
-                    animation_thread.start()
-                    
-                    logger.debug(f"Generating response for {participant.name}")
-                    limited_history = self.get_limited_history()
-                    
-                    response = participant.generate_response(limited_history, is_final_round)
-                    
-                    self.thinking = False
-                    self.stop_event.set()
-                    animation_thread.join()
-                    self.stop_event.clear()
-
-                    # Store the response with the participant's name as the role
-                    self.conversation_history.append({"role": participant.name, "content": response})
-                    logger.info(f"Added response from {participant.name} to conversation history")
-                    
-                    # Display the conversation with participant names
-                    display_conversation(self.conversation_history)
+            if self.converged:
+                logger.info("The moderator already ended this conversation")
+            elif self.scheduler == 'parallel':
+                for round_num in range(self.completed_turns // self.num_participants, self.num_rounds):
+                    await self.run_parallel_round(round_num)
+                    if await self.check_convergence(round_num):
+                        break
+            else:
+                await self.run_turns()
 
+            self.log_run_summary()
             return self.conversation_history
-        except KeyboardInterrupt:
+        except asyncio.CancelledError:
             logger.warning("Conversation interrupted by user.")
             return self.conversation_history
         except Exception as e:
             logger.error(f"An error occurred during the conversation: {e}", exc_info=True)
+            self.error = e
             return self.conversation_history
         finally:
-            self.stop_event.set()
+            if self.summary_task:
+                self.summary_task.cancel()
+            if self.transcript:
+                self.transcript.close()
+
+    async def run_turns(self):
+        # Pipelined mode sends the next request as soon as the history is updated, and only then
+        # renders and logs the previous turn, so the server is not idle during client bookkeeping.
+        # Streaming renders while generating, so it always runs strictly sequentially.
+        pipelined = self.scheduler == 'pipelined' and not self.stream
+        turns = [(round_num, participant) for round_num in range(self.num_rounds) for participant in self.participants]
+        next_request = None
+        round_start = time.perf_counter()
+        try:
+            for index, (round_num, participant) in enumerate(turns):
+                if index < self.completed_turns:
+                    continue
+                is_final_round = (round_num == self.num_rounds - 1)
+                if participant is self.participants[0]:
+                    logger.info("Starting round %d", round_num + 1)
+                    round_start = time.perf_counter()
+
+                if next_request is None:
+                    response = await self.take_turn(participant, is_final_round)
+                else:
+                    response = await self.wait_for_response(participant.name, next_request)
+                    next_request = None
+                entry = self.complete_turn(participant, response, round_num)
+
+                # The request after a round is held back while the moderator decides whether there is one
+                check_due = participant is self.participants[-1] and self.convergence_due(round_num)
+                if pipelined and index + 1 < len(turns) and not check_due:
+                    next_round, next_participant = turns[index + 1]
+                    next_request = asyncio.create_task(next_participant.generate_response(next_round == self.num_rounds - 1))
+
+                # Sequential turns are streamed into a live panel when streaming is on
+                self.display_turn(entry, streamed=self.stream)
+                if participant is self.participants[-1]:
+                    self.end_round(round_num, round_start)
+                    if await self.check_convergence(round_num):
+                        break
+        finally:
+            if next_request:
+                next_request.cancel()
+
+    async def run_parallel_round(self, round_num):
+        # Every participant answers the same snapshot of the history concurrently
+        logger.info("Starting parallel round %d", round_num + 1)
+        round_start = time.perf_counter()
+        is_final_round = (round_num == self.num_rounds - 1)
+        # A resumed round only asks the participants who have not answered yet
+        skipped = max(self.completed_turns - round_num * self.num_participants, 0)
+        participants = self.participants[skipped:]
+        requests = asyncio.gather(*(participant.generate_response(is_final_round) for participant in participants))
+        responses = await self.wait_for_response("Participants", requests)
+        for participant, response in zip(participants, responses):
+            self.display_turn(self.complete_turn(participant, response, round_num))
+        self.end_round(round_num, round_start)
+
+    def complete_turn(self, participant, response, round_num):
+        if participant.last_turn_stats:
+            stats = dict(participant.last_turn_stats, round=round_num + 1)
+            self.turn_stats.append(stats)
+            self.turn_totals.add(stats)
+            metrics.record("turn", conversation=self.conversation_id, **{field: stats.get(field) for field in METRIC_FIELDS})
+
+        entry = self.turn_entry(participant, response)
+        if entry.get('status') == 'failed':
+            self.failed_turns += 1
+        self.record_entry(entry)
+        logger.info("Added response from %s to conversation history", participant.name)
+        return entry
+
+    def turn_entry(self, participant, response):
+        # Store the response with the participant's name as the role; a turn that failed after
+        # retries is kept in the transcript as failed, without content, so every view can skip it
+        if response is None:
+            return {"role": participant.name, "content": "", "status": "failed", "error": participant.last_error}
+        return {"role": participant.name, "content": response}
+
+    def display_turn(self, entry, streamed=False):
+        if self.interactive and not streamed:
+            from cli import display_message
+            # Only the new message is drawn; the live panel already shows streamed ones
+            display_message(entry)
+        self.schedule_summary()
+
+    def end_round(self, round_num, round_start):
+        duration = time.perf_counter() - round_start
+        self.round_durations.append(duration)
+        logger.info("Round %d took %.2fs (%s scheduler)", round_num + 1, duration, self.scheduler)
+
+    def convergence_due(self, round_num):
+        return self.convergence_check and self.min_rounds <= round_num + 1 < self.num_rounds
+
+    async def check_convergence(self, round_num):
+        # Asks the moderator whether the conversation is over; if so the remaining rounds are skipped
+        if not self.convergence_due(round_num):
+            return False
+        entries = [entry for entry in self.conversation_history.recent(2 * self.num_participants)
+                   if entry.get('status') != 'failed']
+        if not entries:
+            return False
+        start_time = time.perf_counter()
+        converged = await self.wait_for_response("Moderator", self.moderator.check_convergence_async(self.topic, entries))
+        self.convergence_checks += 1
+        self.check_time += time.perf_counter() - start_time
+        if not converged:
+            return False
+
+        # The skipped turns are estimated from the average turn so far
+        self.skipped_turns = (self.num_rounds - round_num - 1) * self.num_participants
+        totals = self.turn_totals
+        if totals.turns:
+            self.skipped_tokens = self.skipped_turns * totals.eval_count // totals.turns
+            self.skipped_time = self.skipped_turns * totals.duration / totals.turns
+        entry = {"role": "system", "status": "converged",
+                 "content": f"The moderator ended the conversation after round {round_num + 1} of {self.num_rounds}: "
+                            "it had reached a conclusion or was repeating itself."}
+        self.record_entry(entry)
+        self.converged = True
+        if self.interactive:
+            from cli import display_message
+            display_message(entry)
+        logger.info("Conversation converged after round %d; skipping %d turns", round_num + 1, self.skipped_turns)
+        return True
+
+    def savings(self):
+        # Generation avoided by cutting replies at the sentence limit and by ending the conversation early.
+        # A cut reply is credited with the tokens left before num_predict, so this is an upper bound
+        totals = self.turn_totals
+        return {
+            "cut_turns": totals.cut_turns,
+            "skipped_turns": self.skipped_turns,
+            "convergence_checks": self.convergence_checks,
+            "tokens_saved": totals.tokens_saved + self.skipped_tokens,
+            "time_saved": totals.time_saved + self.skipped_time - self.check_time,
+        }
+
+    def schedule_summary(self):
+        # Summaries are refreshed in the background, batched every summary_interval turns
+        turns = self.conversation_history.turns
+        if not self.summary_interval or turns % self.summary_interval or not self.evicted_entries:
+            return
+        if self.summary_task and not self.summary_task.done():
+            logger.debug("Previous summary is still being generated; deferring refresh")
+            return
+        entries = self.evicted_entries[:]
+        self.evicted_entries.clear()
+        self.summary_task = asyncio.create_task(self.refresh_summary(entries))
+
+    async def refresh_summary(self, entries):
+        logger.info("Summarizing %d messages that left the history window", len(entries))
+        summary = await self.moderator.summarize_async(self.summary, entries)
+        if summary is None:
+            # Keep the messages so they are folded into the next refresh instead
+            self.evicted_entries[:0] = entries
+            return
+        self.summary = summary
+        self.history_window.set_summary({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+        for participant in self.participants:
+            participant.set_summary(summary)
+        logger.info("Updated conversation summary: %s", Truncated(summary))
+
+    def log_run_summary(self):
+        if self.failed_turns:
+            logger.warning(f"{self.failed_turns} turns failed after retries and were left without a reply")
+        totals = self.turn_totals
+        if not totals.turns:
+            return
+        share = totals.prompt_eval_duration / totals.duration * 100 if totals.duration > 0 else 0.0
+        logger.info(f"Prompt evaluation: {totals.prompt_eval_count} tokens in {totals.prompt_eval_duration:.2f}s "
+                    f"({share:.1f}% of generation time over {totals.turns} turns)")
+        if self.round_durations:
+            average = sum(self.round_durations) / len(self.round_durations)
+            logger.info(f"Average round wall-clock time: {average:.2f}s over {len(self.round_durations)} rounds "
+                        f"({self.scheduler} scheduler)")
+        savings = self.savings()
+        if savings['cut_turns'] or savings['skipped_turns'] or savings['convergence_checks']:
+            logger.info(f"Early stop: {savings['cut_turns']} replies cut at the sentence limit, {savings['skipped_turns']} turns "
+                        f"skipped after {savings['convergence_checks']} convergence checks; saved up to "
+                        f"{savings['tokens_saved']} tokens and {savings['time_saved']:.1f}s")
+
+    async def take_turn(self, participant, is_final_round):
+        logger.debug("Generating response for %s", participant.name)
+
+        if self.stream:
+            from cli import display_message, display_live_response_async
+            streamed = await display_live_response_async(participant.name, participant.stream_response(is_final_round))
+            response = participant.last_response
+            if response != streamed.strip():
+                # The stream failed or came back empty, show what is actually stored
+                display_message(self.turn_entry(participant, response))
+            return response
+
+        return await self.wait_for_response(participant.name, participant.generate_response(is_final_round))
+
+    async def wait_for_response(self, name, request):
+        if not self.interactive:
+            return await request
+
+        animation_task = asyncio.create_task(animate_thinking_async(name))
+        try:
+            return await request
+        finally:
+            animation_task.cancel()
+            await asyncio.gather(animation_task, return_exceptions=True)
 
     def format_conversation_for_display(self):
         formatted_history = []
-        for i, message in enumerate(self.conversation_history):
+        previous = None
+        for message in self.conversation_history:
             if message['role'] == 'user':
                 # Find the preceding system message to get the participant's name
-                if i > 0 and self.conversation_history[i-1]['role'] == 'system':
-                    participant_name = self.conversation_history[i-1]['content']
+                if previous is not None and previous['role'] == 'system':
+                    participant_name = previous['content']
                     formatted_history.append({"role": participant_name, "content": message['content']})
             else:
                 formatted_history.append(message)
+            previous = message
         return formatted_history
\ No newline at end of file
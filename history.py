@@ -0,0 +1,68 @@
+from collections import deque
+from itertools import chain
+
+class HistoryWindow:
+    # System messages are always kept; other messages slide through a window bounded by
+    # message count and/or token budget. With block_size > 1 the oldest messages are dropped
+    # a block at a time, so the prompt prefix stays unchanged (and cacheable by Ollama) between evictions.
+    def __init__(self, max_messages=None, block_size=1, max_tokens=None, tokenizer=None, on_evict=None):
+        self.max_messages = max_messages
+        self.block_size = max(block_size, 1)
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer
+        self.on_evict = on_evict
+        self.system_messages = []
+        # Optional system message summarising evicted history, placed between system messages and the window
+        self.summary = None
+        self.summary_tokens = 0
+        self.messages = deque()
+        # Running token counts, computed once per message
+        self.token_counts = deque()
+        self.system_tokens = 0
+        self.message_tokens = 0
+
+    @property
+    def total_tokens(self):
+        return self.system_tokens + self.summary_tokens + self.message_tokens
+
+    def set_summary(self, message):
+        self.summary = message
+        self.summary_tokens = self.tokenizer(message['content']) if self.tokenizer and message else 0
+        self.enforce_token_budget()
+
+    def append(self, message, system=False):
+        tokens = self.tokenizer(message['content']) if self.tokenizer else 0
+        if system:
+            self.system_messages.append(message)
+            self.system_tokens += tokens
+            return
+
+        self.messages.append(message)
+        self.token_counts.append(tokens)
+        self.message_tokens += tokens
+
+        if self.max_messages is not None and len(self.messages) >= self.max_messages + self.block_size:
+            self.evict(self.block_size)
+        self.enforce_token_budget()
+
+    def enforce_token_budget(self):
+        # The newest message is always kept, even if it alone exceeds the budget
+        while self.max_tokens is not None and self.total_tokens > self.max_tokens and len(self.messages) > 1:
+            self.evict(min(self.block_size, len(self.messages) - 1))
+
+    def evict(self, count):
+        evicted = []
+        for _ in range(count):
+            evicted.append(self.messages.popleft())
+            self.message_tokens -= self.token_counts.popleft()
+        if self.on_evict:
+            self.on_evict(evicted)
+        return evicted
+
+    def __iter__(self):
+        if self.summary:
+            return chain(self.system_messages, (self.summary,), self.messages)
+        return chain(self.system_messages, self.messages)
+
+    def __len__(self):
+        return len(self.system_messages) + bool(self.summary) + len(self.messages)
@@ -0,0 +1,132 @@
+import json
+import os
+import sys
+import tempfile
+import weakref
+from collections import deque
+from itertools import chain, islice
+from transcript import iter_entries
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+class Turn:
+    # Compact form of a transcript entry; role names are interned so thousands of turns share a few strings
+    __slots__ = ("role", "content", "status", "error")
+
+    def __init__(self, entry):
+        self.role = sys.intern(entry['role'])
+        self.content = entry.get('content', "")
+        self.status = entry.get('status')
+        self.error = entry.get('error')
+
+    def as_dict(self):
+        entry = {"role": self.role, "content": self.content}
+        if self.status:
+            entry.update(status=self.status, error=self.error)
+        return entry
+
+def remove_spill_file(spill_file):
+    spill_file.close()
+    os.unlink(spill_file.name)
+
+def open_spill_file(owner, prefix):
+    # A temporary JSONL file for records evicted from memory, removed once its owner is garbage collected
+    spill_file = tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.jsonl', prefix=prefix, delete=False)
+    weakref.finalize(owner, remove_spill_file, spill_file)
+    return spill_file
+
+class HistoryStore:
+    # The full conversation, with only the system entries and the most recent `resident` turns in memory.
+    # Older turns are read back from disk when iterated: from the conversation's JSONL transcript when
+    # there is one (every entry is already written there), otherwise from a spill file of evicted turns.
+    def __init__(self, resident=200, transcript_path=None):
+        self.resident = resident
+        self.transcript_path = transcript_path
+        self.system_entries = []
+        # Number of turns recorded before each system entry, so iteration puts it back in its place
+        self.system_positions = []
+        self.recent_turns = deque()
+        self.spilled = 0
+        self.spill_file = None
+        # Aggregates over every turn, resident or not
+        self.turns = 0
+        self.failed_turns = 0
+        self.content_chars = 0
+
+    def append(self, entry):
+        if entry['role'] == 'system':
+            self.system_entries.append(entry)
+            self.system_positions.append(self.turns)
+            return
+        turn = Turn(entry)
+        self.recent_turns.append(turn)
+        self.turns += 1
+        self.content_chars += len(turn.content)
+        if turn.status == 'failed':
+            self.failed_turns += 1
+        if self.resident is not None and len(self.recent_turns) > self.resident:
+            self.spill(self.recent_turns.popleft())
+
+    def spill(self, turn):
+        self.spilled += 1
+        if self.transcript_path:
+            return
+        if self.spill_file is None:
+            # Removed once the store is garbage collected, after the conversation has been exported
+            self.spill_file = open_spill_file(self, 'convollama_history_')
+            logger.info(f"Spilling older turns to {self.spill_file.name}")
+        self.spill_file.write(json.dumps(turn.as_dict(), ensure_ascii=False) + "\n")
+
+    def spilled_turns(self):
+        if self.transcript_path:
+            turns = (entry for entry in iter_entries(self.transcript_path) if entry['role'] != 'system')
+            return islice(turns, self.spilled)
+        self.spill_file.flush()
+        return self.read_spill_file()
+
+    def read_spill_file(self):
+        with open(self.spill_file.name, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def recent(self, count=None):
+        # The last `count` turns (all of them for None), reading from disk only if they are not resident
+        if count is not None and count <= len(self.recent_turns):
+            return [turn.as_dict() for turn in islice(self.recent_turns, len(self.recent_turns) - count, None)]
+        turns = deque((entry for entry in self if entry['role'] != 'system'), maxlen=count)
+        return list(turns)
+
+    def tail(self, count=None):
+        # The last `count` turns with every system entry: those recorded before the first of them at the top,
+        # later ones in their place
+        turns = self.recent(count)
+        first = self.turns - len(turns)
+        system = list(zip(self.system_positions, self.system_entries))
+        entries = [entry for position, entry in system if position <= first]
+        later = deque((position, entry) for position, entry in system if position > first)
+        for position, turn in enumerate(turns, first):
+            while later and later[0][0] <= position:
+                entries.append(later.popleft()[1])
+            entries.append(turn)
+        entries.extend(entry for _, entry in later)
+        return entries
+
+    def __iter__(self):
+        turns = (turn.as_dict() for turn in self.recent_turns)
+        if self.spilled:
+            turns = chain(self.spilled_turns(), turns)
+        system = zip(self.system_positions, self.system_entries)
+        pending = next(system, None)
+        for position, turn in enumerate(turns):
+            while pending is not None and pending[0] <= position:
+                yield pending[1]
+                pending = next(system, None)
+            yield turn
+        while pending is not None:
+            yield pending[1]
+            pending = next(system, None)
+
+    def __len__(self):
+        return len(self.system_entries) + self.turns
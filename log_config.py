@@ -1,23 +1,90 @@
+import atexit
+import copy
 import logging
 import os
+import queue
+import reprlib
 from datetime import datetime
-from rich.logging import RichHandler
+from logging.handlers import QueueHandler, QueueListener
 
-def setup_logging(level):
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
+# Longest payload (messages, responses) written to the log; the rest is cut off
+PAYLOAD_LIMIT = 500
 
+# Items shown per list or dict, and nesting depth, when a payload other than a string is formatted
+PAYLOAD_ITEMS = 8
+PAYLOAD_DEPTH = 4
+
+class Truncated:
+    # Formats a payload only if the record is actually emitted, and then only its first PAYLOAD_LIMIT characters.
+    # Containers go through reprlib, which stops after a few items and cuts long strings, so a long message
+    # history is never serialized in full just to be thrown away
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        if isinstance(self.value, str):
+            text = self.value
+            if len(text) <= PAYLOAD_LIMIT:
+                return text
+            return f"{text[:PAYLOAD_LIMIT]}... ({len(text) - PAYLOAD_LIMIT} more characters)"
+        bounded = reprlib.Repr()
+        bounded.maxlevel = PAYLOAD_DEPTH
+        bounded.maxlist = bounded.maxtuple = bounded.maxdict = bounded.maxset = PAYLOAD_ITEMS
+        bounded.maxstring = bounded.maxother = PAYLOAD_LIMIT
+        text = bounded.repr(self.value)
+        if len(text) <= PAYLOAD_LIMIT:
+            return text
+        return f"{text[:PAYLOAD_LIMIT]}... (truncated)"
+
+class LazyFileHandler(logging.FileHandler):
+    # Neither the log directory nor the file is created until the first record is written
+    def __init__(self, filename):
+        super().__init__(filename, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+class LogQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Only the message is rendered on the caller's thread, so its arguments can change afterwards;
+        # exc_info is kept so the listener's handlers can still render tracebacks themselves
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def queue_handlers(handlers):
+    # Returns a handler that only enqueues records, and the started listener that writes them on its own thread
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return LogQueueHandler(log_queue), listener
+
+def setup_logging(level, log_dir="logs", payload_limit=None, interactive=True):
+    global PAYLOAD_LIMIT
+
+    if payload_limit is not None:
+        PAYLOAD_LIMIT = payload_limit
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     log_file = os.path.join(log_dir, f"convollama_{timestamp}.log")
 
-    logging.basicConfig(
-        level=level,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="[%X]",
-        handlers=[
-            logging.FileHandler(log_file),
-            RichHandler(rich_tracebacks=True, markup=True)
-        ]
-    )
-
-    logging.info(f"Logging initialized. Log file: {log_file}")
+    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s", "[%X]")
+    if interactive:
+        from rich.logging import RichHandler
+        console_handler = RichHandler(rich_tracebacks=True, markup=True)
+    else:
+        # Headless runs write plain lines, without loading rich
+        console_handler = logging.StreamHandler()
+    handlers = [LazyFileHandler(log_file), console_handler]
+    for output in handlers:
+        output.setFormatter(formatter)
+    # Console and file output happen on the listener's thread, off the conversation path
+    handler, listener = queue_handlers(handlers)
+    logging.basicConfig(level=level, handlers=[handler])
+    atexit.register(listener.stop)
+
+    logging.debug(f"Logging initialized. Log file: {log_file}")
+    return listener
@@ -1,62 +1,138 @@
 import argparse
 import sys
 import os
-from datetime import datetime
-from config import load_config
-from log_config import setup_logging
 import logging
 
-# Load config and set up logging immediately
-config = load_config("config.yaml")  # You might want to handle the config path more flexibly
-log_level = getattr(logging, config.get('log_level', 'INFO').upper(), logging.INFO)
-setup_logging(log_level)
+# Nothing is loaded, configured or written at import time; main() does it in order, and the
+# heavier modules (rich, questionary, ollama) are only imported once the arguments are known
 
-# Now import the rest of the modules
-from rich.console import Console
-from cli import get_user_preferences, print_header
-from conversation_manager import ConversationManager
-from moderator import Moderator
-from utils import save_conversation, check_ollama_connection_with_animation, clear_screen
-
-console = Console()
-
-def main(config):
+def main():
     parser = argparse.ArgumentParser(description="Run a moderated AI conversation")
     parser.add_argument("-c", "--config", default="config.yaml", help="Path to the configuration file")
+    parser.add_argument("-b", "--batch", help="Run headless conversations from a YAML/JSONL spec file")
+    parser.add_argument("-j", "--concurrency", type=int, help="Maximum number of conversations in flight in batch mode")
+    parser.add_argument("-r", "--resume", help="Continue a conversation from its .jsonl transcript")
     args = parser.parse_args()
 
-    # Reload the config if a different path was specified
-    if args.config != "config.yaml":
-        config = load_config(args.config)
-        log_level = getattr(logging, config.get('log_level', 'INFO').upper(), logging.INFO)
-        logging.getLogger().setLevel(log_level)
+    from config import load_config
+    from log_config import setup_logging
 
+    config = load_config(args.config)
+    log_level = getattr(logging, config.get('log_level', 'INFO').upper(), logging.INFO)
+    setup_logging(log_level, config.get('log_dir', 'logs'), config.get('log_payload_chars'), interactive=not args.batch)
     logging.info(f"Configuration loaded from {args.config}")
 
+    from ollama_clients import configure_clients, get_chat_kwargs, get_hosts
+    from response_cache import configure_cache
+    from call_policy import configure_policy
+    from metrics import get_collector
+    from utils import check_ollama_connection_with_animation
+
+    configure_clients(config)
+    configure_cache(config)
+    configure_policy(config)
+    metrics_settings = config.get('metrics') or {}
+    if metrics_settings.get('prometheus_port'):
+        get_collector().serve_prometheus(metrics_settings['prometheus_port'], metrics_settings.get('prometheus_host', '127.0.0.1'))
+
     # Check Ollama server connection
-    if not check_ollama_connection_with_animation(config['ollama_host']):
-        logging.error("Failed to connect to the Ollama server.")
-        sys.exit(1)
+    for host in get_hosts(config):
+        if not check_ollama_connection_with_animation(host):
+            logging.error(f"Failed to connect to the Ollama server at {host}.")
+            sys.exit(1)
+
+    if args.batch:
+        run_batch_mode(config, args.batch, args.concurrency)
+        return
+
+    from cli import console, get_user_preferences, print_header, display_warmup
+    from conversation_manager import ConversationManager
+    from moderator import Moderator
+    from warmup import warm_up, model_placement
+    from utils import save_conversation, new_filename_base, transcript_path
 
-    moderator = Moderator(config['moderator_model'], config['ollama_host'])
+    moderator = Moderator(config['moderator_model'], config['ollama_host'], get_chat_kwargs(config))
     logging.info("Moderator initialized")
 
-    print_header("Welcome to ConvOllama")
-    num_participants, model, topic, profiles, num_rounds = get_user_preferences(moderator, config)
-    logging.info(f"User preferences: {num_participants} participants, model: {model}, topic: {topic}, {num_rounds} rounds")
+    if args.resume:
+        # The transcript keeps its own location and name
+        save_path = os.path.dirname(os.path.abspath(args.resume))
+        filename_base = os.path.splitext(os.path.basename(args.resume))[0]
+        manager = ConversationManager.from_transcript(config, args.resume, moderator=moderator)
+    else:
+        print_header("Welcome to ConvOllama")
+        num_participants, model, topic, profiles, num_rounds, participant_models = get_user_preferences(moderator, config)
+        logging.info(f"User preferences: {num_participants} participants, model: {participant_models or model}, topic: {topic}, {num_rounds} rounds")
 
-    manager = ConversationManager(config, num_participants, model, topic, profiles, num_rounds)
+        save_path = config['save_path']
+        filename_base = new_filename_base()
+        manager = ConversationManager(config, num_participants, model, topic, profiles, num_rounds, moderator=moderator,
+                                      transcript_path=transcript_path(save_path, filename_base), conversation_id=filename_base,
+                                      participant_models=participant_models)
     logging.info("Conversation manager initialized")
 
+    # Load every model up front so the first round does not pay for model loads
+    warmup = warm_up(config, model_placement(config, [manager.participant_models]))
+    if warmup:
+        display_warmup(warmup)
+
     conversation_history = manager.run_conversation()
     logging.info("Conversation completed")
 
-    save_conversation(conversation_history, config['save_path'])
-    logging.info(f"Conversation saved to {config['save_path']}")
+    save_conversation(conversation_history, save_path, filename_base)
+    logging.info(f"Conversation saved to {save_path}")
+    report_savings(manager.savings())
+    log_cache_stats()
+    report_metrics(config)
 
     console.print("\n[bold green]Conversation completed and saved.[/bold green]")
     console.print("Press Enter to exit...")
     input()
 
+def run_batch_mode(config, spec_file, concurrency):
+    from batch import run_batch
+    from cli import console, display_warmup
+    summary = run_batch(config, spec_file, concurrency)
+    if summary['warmup']:
+        display_warmup(summary['warmup'])
+    console.print(
+        f"\n[bold green]Batch completed:[/bold green] {summary['conversations']} conversations "
+        f"({summary['failed']} failed, {summary['failed_turns']} turns without a reply) in {summary['elapsed']:.1f}s"
+    )
+    console.print(f"Throughput: {summary['conversations_per_min']:.2f} conversations/min, "
+                  f"{summary['tokens_per_sec']:.1f} tokens/sec "
+                  f"({summary['tokens_per_sec_per_turn']:.1f} tokens/sec per generation)")
+    console.print(f"Conversations saved to {config['save_path']}")
+    report_savings(summary['savings'])
+    log_cache_stats()
+    report_metrics(config)
+
+def report_savings(savings):
+    from cli import console
+    if savings['cut_turns'] or savings['skipped_turns']:
+        console.print(f"Early stop: {savings['cut_turns']} replies cut at the sentence limit, "
+                      f"{savings['skipped_turns']} turns skipped after the conversation concluded; "
+                      f"saved up to {savings['tokens_saved']} tokens and {savings['time_saved']:.1f}s")
+
+def report_metrics(config):
+    from cli import console
+    from metrics import get_collector
+    collector = get_collector()
+    for model, stats in collector.summary().items():
+        console.print(f"[bold]{model}[/bold]: {stats['calls']} calls, {stats['tokens_per_sec']:.1f} tokens/sec, "
+                      f"prompt eval {stats['prompt_eval_share']:.0%} of time, "
+                      f"{stats['load_stalls']} load stalls ({stats['load_time']:.1f}s loading)")
+    export_path = (config.get('metrics') or {}).get('export_path')
+    if export_path:
+        collector.export(os.path.expanduser(export_path))
+
+def log_cache_stats():
+    from cli import console
+    from response_cache import get_cache
+    cache = get_cache()
+    if cache:
+        stats = cache.stats()
+        console.print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+
 if __name__ == "__main__":
-    main(config)
\ No newline at end of file
+    main()
\ No newline at end of file
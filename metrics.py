@@ -0,0 +1,210 @@
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from history_store import open_spill_file
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+FIELDS = [
+    "timestamp", "kind", "conversation", "participant", "model", "host", "round", "cached",
+    "duration", "ttft", "total_duration", "load_duration",
+    "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+]
+
+# A model load longer than this counts as a stall in the summary
+LOAD_STALL_SECONDS = 0.5
+
+def response_timings(response):
+    # Ollama reports durations in nanoseconds; everything here is in seconds
+    return {
+        "total_duration": response.get('total_duration', 0) / 1e9,
+        "load_duration": response.get('load_duration', 0) / 1e9,
+        "prompt_eval_count": response.get('prompt_eval_count', 0),
+        "prompt_eval_duration": response.get('prompt_eval_duration', 0) / 1e9,
+        "eval_count": response.get('eval_count', 0),
+        "eval_duration": response.get('eval_duration', 0) / 1e9,
+    }
+
+# Counters kept per (kind, model, host) for the Prometheus endpoint, and the record field each one sums
+PROMETHEUS_COUNTERS = {
+    "convollama_request_seconds_total": "duration",
+    "convollama_load_seconds_total": "load_duration",
+    "convollama_prompt_eval_tokens_total": "prompt_eval_count",
+    "convollama_prompt_eval_seconds_total": "prompt_eval_duration",
+    "convollama_eval_tokens_total": "eval_count",
+    "convollama_eval_seconds_total": "eval_duration",
+}
+
+class TurnTotals:
+    # Running sums over a conversation's turns, so the summaries do not need every turn's stats kept in memory
+    def __init__(self):
+        self.turns = 0
+        self.duration = 0.0
+        self.prompt_eval_count = 0
+        self.prompt_eval_duration = 0.0
+        self.eval_count = 0
+        # Replies cut at the sentence limit, with the generation that avoided
+        self.cut_turns = 0
+        self.tokens_saved = 0
+        self.time_saved = 0.0
+
+    def add(self, stats):
+        self.turns += 1
+        self.duration += stats['duration']
+        self.prompt_eval_count += stats['prompt_eval_count']
+        self.prompt_eval_duration += stats['prompt_eval_duration']
+        self.eval_count += stats['eval_count']
+        if stats.get('cut'):
+            self.cut_turns += 1
+            self.tokens_saved += stats['tokens_saved']
+            if stats['tokens_per_sec'] > 0:
+                self.time_saved += stats['tokens_saved'] / stats['tokens_per_sec']
+
+class MetricsCollector:
+    # Summaries and Prometheus counters are kept as running totals. Only the latest `resident` records
+    # stay in memory for export; older ones are spilled to a temporary JSONL file and read back from there
+    def __init__(self, resident=1000):
+        self.resident = resident
+        self.records = deque()
+        self.spill_file = None
+        self.by_model = defaultdict(lambda: defaultdict(float))
+        self.counters = defaultdict(lambda: defaultdict(float))
+        self.lock = threading.Lock()
+
+    def record(self, kind, **fields):
+        record = {field: None for field in FIELDS}
+        record.update(fields, kind=kind, timestamp=time.time())
+        with self.lock:
+            self.add_totals(record)
+            self.records.append(record)
+            if len(self.records) > self.resident:
+                self.spill(self.records.popleft())
+        return record
+
+    def add_totals(self, record):
+        totals = self.by_model[record['model']]
+        totals['calls'] += 1
+        totals['turns'] += record['kind'] == 'turn'
+        for field in ('eval_count', 'eval_duration', 'prompt_eval_count', 'prompt_eval_duration', 'total_duration'):
+            totals[field] += record[field] or 0
+        load_duration = record['load_duration'] or 0
+        totals['load_time'] += load_duration
+        totals['load_stalls'] += load_duration > LOAD_STALL_SECONDS
+
+        labels = (record['kind'], record['model'] or "", record['host'] or "")
+        self.counters["convollama_requests_total"][labels] += 1
+        for name, field in PROMETHEUS_COUNTERS.items():
+            self.counters[name][labels] += record[field] or 0
+
+    def spill(self, record):
+        if self.spill_file is None:
+            self.spill_file = open_spill_file(self, 'convollama_metrics_')
+        self.spill_file.write(json.dumps(record) + "\n")
+
+    def all_records(self):
+        # Every record, oldest first, for export
+        spilled_size = 0
+        with self.lock:
+            records = list(self.records)
+            if self.spill_file is not None:
+                self.spill_file.flush()
+                spilled_size = self.spill_file.tell()
+        if spilled_size:
+            # Only what was spilled before the snapshot; later spills are still in the resident copy above
+            with open(self.spill_file.name, 'rb') as f:
+                for line in f:
+                    spilled_size -= len(line)
+                    if spilled_size < 0:
+                        break
+                    yield json.loads(line)
+        yield from records
+
+    def summary(self):
+        with self.lock:
+            by_model = {model: dict(totals) for model, totals in self.by_model.items()}
+
+        summary = {}
+        for model, totals in by_model.items():
+            summary[model] = {
+                "calls": int(totals['calls']),
+                "turns": int(totals['turns']),
+                "eval_tokens": int(totals['eval_count']),
+                "tokens_per_sec": totals['eval_count'] / totals['eval_duration'] if totals['eval_duration'] > 0 else 0.0,
+                "prompt_eval_tokens": int(totals['prompt_eval_count']),
+                "prompt_eval_share": totals['prompt_eval_duration'] / totals['total_duration'] if totals['total_duration'] > 0 else 0.0,
+                "load_stalls": int(totals['load_stalls']),
+                "load_time": totals['load_time'],
+            }
+        return summary
+
+    def export_json(self, path):
+        records = list(self.all_records())
+        with open(path, 'w') as f:
+            json.dump({"records": records, "summary": self.summary()}, f, indent=2)
+        logger.info(f"Exported {len(records)} metric records to {path}")
+
+    def export_csv(self, path):
+        import csv
+        count = 0
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            for record in self.all_records():
+                writer.writerow(record)
+                count += 1
+        logger.info(f"Exported {count} metric records to {path}")
+
+    def export(self, path):
+        if path.endswith('.csv'):
+            self.export_csv(path)
+        else:
+            self.export_json(path)
+
+    def prometheus_text(self):
+        with self.lock:
+            totals = {name: dict(series) for name, series in self.counters.items()}
+
+        lines = []
+        for name, series in totals.items():
+            lines.append(f"# TYPE {name} counter")
+            for (kind, model, host), value in sorted(series.items()):
+                lines.append(f'{name}{{kind="{kind}",model="{model}",host="{host}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port, host="127.0.0.1"):
+        # The HTTP server is only imported when metrics are actually served
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        collector = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                data = collector.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"Serving Prometheus metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+_collector = MetricsCollector()
+
+def get_collector():
+    return _collector
+
+def record(kind, **fields):
+    return _collector.record(kind, **fields)
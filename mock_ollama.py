@@ -0,0 +1,255 @@
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+REPLY_SENTENCES = [
+    "That is an interesting point, but I see it differently.",
+    "The evidence on this question is more mixed than it first appears.",
+    "We should also consider who bears the cost of each option.",
+    "History offers a few useful precedents here.",
+    "I think we agree on more than it seems.",
+]
+
+# Models /api/tags reports as installed, matching the example configuration
+INSTALLED_MODELS = ["wizardlm2:latest", "llama3.1:latest", "gemma2:latest", "falcon2:latest"]
+
+class MockOllamaState:
+    def __init__(self, latency=0.05, tokens_per_sec=200.0, prompt_tokens_per_sec=2000.0, load_time=0.0,
+                 reply_sentences=3, slots=4, fail_rate=0.0, installed_models=None):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.prompt_tokens_per_sec = prompt_tokens_per_sec
+        self.load_time = load_time
+        self.reply_sentences = reply_sentences
+        self.slots = slots
+        # Share of generation requests answered with 503, to exercise client retries
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        # Installed models are listed by /api/tags, loaded ones by /api/ps. Any requested model is served,
+        # and is listed as installed from then on
+        self.installed_models = set(INSTALLED_MODELS if installed_models is None else installed_models)
+        self.loaded_models = set()
+        # Recent prompts per model, one per parallel slot, to simulate Ollama reusing a cached prompt prefix
+        self.cached_prompts = {}
+        self.requests = 0
+
+    def prepare(self, model, prompt_tokens, reply_tokens):
+        # Returns (load_duration, prompt tokens that need evaluating); like Ollama, the request takes the
+        # slot whose cached context shares the longest prefix, or the least recently used one, and the slot
+        # then holds the prompt followed by the generated reply
+        with self.lock:
+            self.requests += 1
+            load_duration = 0.0
+            if model not in self.loaded_models:
+                self.installed_models.add(model)
+                self.loaded_models.add(model)
+                load_duration = self.load_time
+            cached = self.cached_prompts.setdefault(model, [])
+            best_slot, common = None, 0
+            for slot, previous in enumerate(cached):
+                shared = common_prefix(previous, prompt_tokens)
+                if best_slot is None or shared > common:
+                    best_slot, common = slot, shared
+            if best_slot is not None and common * 2 >= len(cached[best_slot]):
+                # Mostly the same context: continue in that slot
+                cached.pop(best_slot)
+            else:
+                # Diverges early from every cached context: start from scratch in a free or the oldest slot
+                if len(cached) >= self.slots:
+                    cached.pop(0)
+                common = 0
+            cached.append(prompt_tokens + ["<assistant>"] + "".join(reply_tokens).split())
+        return load_duration, len(prompt_tokens) - common
+
+    def reply_tokens(self, num_predict=None):
+        words = " ".join(REPLY_SENTENCES[i % len(REPLY_SENTENCES)] for i in range(self.reply_sentences)).split(" ")
+        tokens = [word + " " for word in words]
+        if num_predict is not None and num_predict >= 0:
+            tokens = tokens[:num_predict]
+        return tokens
+
+def common_prefix(a, b):
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+def prompt_tokens(messages):
+    tokens = []
+    for message in messages:
+        tokens.append(f"<{message.get('role')}>")
+        tokens.extend(message.get('content', '').split())
+    return tokens
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Small NDJSON chunks would otherwise be held back by Nagle's algorithm
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json({"models": [{"name": model, "model": model} for model in sorted(self.state.installed_models)]})
+        elif self.path == "/api/ps":
+            self.send_json({"models": [{"name": model, "model": model, "size_vram": 0} for model in sorted(self.state.loaded_models)]})
+        else:
+            self.send_json({"error": f"unknown endpoint {self.path}"}, 404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path in ("/api/chat", "/api/generate") and random.random() < self.state.fail_rate:
+            self.send_json({"error": "server busy, please try again"}, 503)
+        elif self.path == "/api/chat":
+            self.handle_generation(request, prompt_tokens(request.get("messages", [])), chat=True)
+        elif self.path == "/api/generate":
+            self.handle_generation(request, request.get("prompt", "").split(), chat=False)
+        else:
+            self.send_json({"error": f"unknown endpoint {self.path}"}, 404)
+
+    def handle_generation(self, request, tokens, chat):
+        model = request.get("model", "")
+        options = request.get("options") or {}
+        # An empty generate request only loads the model, as Ollama does
+        reply = self.state.reply_tokens(options.get("num_predict")) if tokens or chat else []
+        load_duration, prompt_eval_count = self.state.prepare(model, tokens, reply)
+        prompt_eval_duration = prompt_eval_count / self.state.prompt_tokens_per_sec
+        time.sleep(self.state.latency + load_duration + prompt_eval_duration)
+
+        stats = {
+            "model": model,
+            "done": True,
+            "total_duration": 0,
+            "load_duration": int(load_duration * 1e9),
+            "prompt_eval_count": prompt_eval_count,
+            "prompt_eval_duration": int(prompt_eval_duration * 1e9),
+            "eval_count": len(reply),
+            "eval_duration": int(len(reply) / self.state.tokens_per_sec * 1e9),
+        }
+        stats["total_duration"] = int((self.state.latency + load_duration + prompt_eval_duration) * 1e9) + stats["eval_duration"]
+
+        if not request.get("stream", True):
+            time.sleep(len(reply) / self.state.tokens_per_sec)
+            self.send_json(dict(stats, **self.content_fields("".join(reply), chat)))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in reply:
+                time.sleep(1 / self.state.tokens_per_sec)
+                self.send_chunk(dict(model=model, done=False, **self.content_fields(token, chat)))
+            self.send_chunk(dict(stats, **self.content_fields("", chat)))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, as Ollama sees when a stream is abandoned
+            logger.debug("Client closed the stream early")
+            self.close_connection = True
+
+    def content_fields(self, text, chat):
+        if chat:
+            return {"message": {"role": "assistant", "content": text}}
+        return {"response": text}
+
+    def send_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class MockOllamaServer:
+    # Speaks the parts of the Ollama HTTP API this project uses, with simulated latency and token rates
+    def __init__(self, host="127.0.0.1", port=0, **settings):
+        self.httpd = ThreadingHTTPServer((host, port), MockOllamaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = MockOllamaState(**settings)
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def state(self):
+        return self.httpd.state
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Mock Ollama server listening on {self.url}")
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Ollama API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every request")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0, help="Simulated generation speed")
+    parser.add_argument("--prompt-tokens-per-sec", type=float, default=2000.0, help="Simulated prompt evaluation speed")
+    parser.add_argument("--load-time", type=float, default=0.0, help="Seconds to 'load' a model on first use")
+    parser.add_argument("--reply-sentences", type=int, default=3, help="Sentences in every reply")
+    parser.add_argument("--slots", type=int, default=4, help="Parallel slots, each caching one prompt prefix")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of generation requests answered with 503")
+    parser.add_argument("--models", nargs="+", help="Models listed as installed by /api/tags")
+    args = parser.parse_args()
+
+    server = MockOllamaServer(args.host, args.port, latency=args.latency, tokens_per_sec=args.tokens_per_sec,
+                              prompt_tokens_per_sec=args.prompt_tokens_per_sec, load_time=args.load_time,
+                              reply_sentences=args.reply_sentences, slots=args.slots, fail_rate=args.fail_rate,
+                              installed_models=args.models)
+    # The URL goes to stdout first so a parent process can pick up an ephemeral port
+    print(server.url, flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,112 @@
-import ollama
+import asyncio
+import time
+from ollama_clients import get_client, get_async_client
+import response_cache
+from call_policy import get_policy
+import metrics
+from metrics import response_timings
 import logging
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 class Moderator:
-    def __init__(self, model, ollama_host="http://localhost:11434"):
+    def __init__(self, model, ollama_host="http://localhost:11434", chat_kwargs=None):
         self.model = model
-        self.client = ollama.Client(host=ollama_host)
+        self.chat_kwargs = chat_kwargs or {}
+        self.ollama_host = ollama_host
+        self.client = get_client(ollama_host)
 
     def generate_topic(self, keywords):
-        prompt = f"Based on these keywords: {', '.join(keywords)}, generate an interesting conversation topic. Respond with just the topic in 1-2 sentences, nothing else."
-        return self._generate_content(prompt, "topic", "General Discussion")
+        return self._generate_content(*self._topic_request(keywords))
 
     def generate_profile(self, topic, participant_num):
+        return self._generate_content(*self._profile_request(topic, participant_num))
+
+    def generate_topics(self, keywords, count):
+        # Candidate topics are requested concurrently so a rejection does not cost another round trip
+        return self._generate_concurrently([self._topic_request(keywords) for _ in range(count)])
+
+    def generate_profiles(self, topic, participant_nums):
+        return self._generate_concurrently([self._profile_request(topic, num) for num in participant_nums])
+
+    async def summarize_async(self, previous_summary, entries):
+        # Folds messages that fell out of the history window into the running summary
+        transcript = "\n".join(f"{entry['role']}: {entry['content']}" for entry in entries)
+        prompt = "Summarize the following part of a conversation so the participants can keep track of its thread. "
+        if previous_summary:
+            prompt += f"Extend this summary of what came before it: {previous_summary}\n\n"
+        prompt += f"Messages:\n{transcript}\n\nRespond with just the updated summary in at most 5 sentences, nothing else."
+        return await self._generate_content_async(get_async_client(self.ollama_host), prompt, "summary")
+
+    async def check_convergence_async(self, topic, entries):
+        # True once the latest messages show the conversation has reached a conclusion or is going in circles
+        transcript = "\n".join(f"{entry['role']}: {entry['content']}" for entry in entries)
+        prompt = (f"These are the latest messages of a conversation about {topic}:\n{transcript}\n\n"
+                  "Has the conversation reached a conclusion, or are the participants repeating themselves? "
+                  "Answer with just YES or NO.")
+        verdict = await self._generate_content_async(get_async_client(self.ollama_host), prompt, "convergence",
+                                                     {"num_predict": 4, "temperature": 0})
+        logger.info("Convergence check: %s", verdict)
+        return verdict is not None and verdict.strip(' *"\'.').upper().startswith("YES")
+
+    def _topic_request(self, keywords):
+        prompt = f"Based on these keywords: {', '.join(keywords)}, generate an interesting conversation topic. Respond with just the topic in 1-2 sentences, nothing else."
+        return prompt, "topic"
+
+    def _profile_request(self, topic, participant_num):
         prompt = f"For a conversation about '{topic}', create an interesting and unique profile or viewpoint for Participant {participant_num}. The profile should be somewhat opinionated to encourage debate. Respond with just the profile description in 1-2 sentences max, nothing else."
-        return self._generate_content(prompt, "profile", f"Participant {participant_num} with a general interest in the topic")
+        return prompt, "profile"
+
+    def _generate_content(self, prompt, content_type):
+        # Returns None when the request fails; there is no canned default to mistake for generated content
+        messages = [{"role": "user", "content": prompt}]
+        key, cached = response_cache.lookup(self.model, messages, self.chat_kwargs.get('options'))
+        if cached:
+            return cached['message']['content'].strip()
+        try:
+            start_time = time.perf_counter()
+            response = get_policy().call(
+                self.ollama_host, lambda: self.client.chat(model=self.model, messages=messages, **self.chat_kwargs),
+                f"Moderator {content_type}")
+            self._record_metrics(content_type, response, start_time)
+            content = response['message']['content'].strip()
+            response_cache.store(key, self.model, response)
+            return content
+        except Exception as e:
+            logger.error(f"Error generating {content_type}: {e}")
+            return None
+
+    def _record_metrics(self, content_type, response, start_time):
+        metrics.record("moderator", participant=f"Moderator ({content_type})", model=self.model, host=self.ollama_host,
+                       duration=time.perf_counter() - start_time, **response_timings(response))
+
+    def _generate_concurrently(self, requests):
+        return asyncio.run(self._gather_content(requests))
+
+    async def _gather_content(self, requests):
+        client = get_async_client(self.ollama_host)
+        logger.info(f"Sending {len(requests)} moderator requests concurrently")
+        return await asyncio.gather(*(self._generate_content_async(client, *request) for request in requests))
 
-    def _generate_content(self, prompt, content_type, default_response):
+    async def _generate_content_async(self, client, prompt, content_type, options=None):
+        messages = [{"role": "user", "content": prompt}]
+        chat_kwargs = self.chat_kwargs
+        if options:
+            # Per-request options, such as a short num_predict for a one-word answer
+            chat_kwargs = dict(chat_kwargs, options=dict(chat_kwargs.get('options') or {}, **options))
+        key, cached = response_cache.lookup(self.model, messages, chat_kwargs.get('options'))
+        if cached:
+            return cached['message']['content'].strip()
         try:
-            response = self.client.chat(model=self.model, messages=[{"role": "user", "content": prompt}])
-            return response['message']['content'].strip()
+            start_time = time.perf_counter()
+            response = await get_policy().call_async(
+                self.ollama_host, lambda: client.chat(model=self.model, messages=messages, **chat_kwargs),
+                f"Moderator {content_type}")
+            self._record_metrics(content_type, response, start_time)
+            content = response['message']['content'].strip()
+            response_cache.store(key, self.model, response)
+            return content
         except Exception as e:
             logger.error(f"Error generating {content_type}: {e}")
-            return default_response
\ No newline at end of file
+            return None
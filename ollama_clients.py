@@ -0,0 +1,62 @@
+import asyncio
+import weakref
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+# One client per host, sharing a keep-alive connection pool between every caller
+_client_kwargs = {}
+_clients = {}
+# Async connection pools are bound to the event loop they were opened on
+_async_clients = weakref.WeakKeyDictionary()
+
+def configure_clients(config):
+    # httpx and ollama are slow to import, so they are only loaded once a client is actually needed
+    import httpx
+    settings = config.get('client') or {}
+    timeout = settings.get('timeout')
+    _client_kwargs.clear()
+    _client_kwargs['timeout'] = httpx.Timeout(timeout, connect=settings.get('connect_timeout', timeout))
+    _client_kwargs['limits'] = httpx.Limits(
+        max_connections=settings.get('max_connections', 100),
+        max_keepalive_connections=settings.get('max_keepalive_connections', 20),
+        keepalive_expiry=settings.get('keepalive_expiry', 30)
+    )
+    _clients.clear()
+    _async_clients.clear()
+    logger.info(f"Configured Ollama clients: {settings}")
+
+def get_chat_kwargs(config):
+    # keep_alive and model options (num_ctx, num_predict, ...) passed through to every chat request
+    kwargs = {}
+    if config.get('keep_alive') is not None:
+        kwargs['keep_alive'] = config['keep_alive']
+    if config.get('options'):
+        kwargs['options'] = dict(config['options'])
+    return kwargs
+
+def get_hosts(config):
+    hosts = config.get('ollama_hosts') or [config['ollama_host']]
+    return list(hosts)
+
+def load_aware_routing(config):
+    # With several hosts, requests are routed per call unless participants are pinned round-robin
+    return len(get_hosts(config)) > 1 and (config.get('routing') or {}).get('strategy', 'load_aware') == 'load_aware'
+
+def get_client(host):
+    client = _clients.get(host)
+    if client is None:
+        import ollama
+        client = _clients[host] = ollama.Client(host=host, **_client_kwargs)
+        logger.debug(f"Created Ollama client for {host}")
+    return client
+
+def get_async_client(host):
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(host)
+    if client is None:
+        import ollama
+        client = clients[host] = ollama.AsyncClient(host=host, **_client_kwargs)
+        logger.debug(f"Created async Ollama client for {host}")
+    return client
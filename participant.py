@@ -1,72 +1,289 @@
-import ollama
+import re
+import time
+from contextlib import asynccontextmanager
+from history import HistoryWindow
+from ollama_clients import get_async_client
+from tokens import get_tokenizer
+import response_cache
+from call_policy import get_policy
+from metrics import response_timings
+from log_config import Truncated
 
 # Configure logging
 import logging
 logger = logging.getLogger(__name__)
 
+FINAL_ROUND_PROMPT = "This is your final turn in the conversation. Please share your concluding thoughts or final comments."
+NEXT_TURN_PROMPT = "Please provide your next response in the conversation."
+
+# A candidate sentence end: terminal punctuation and any closing quotes or brackets (group 1), whitespace,
+# then the first character of what follows (group 2), after any opening quotes or brackets
+SENTENCE_END = re.compile(r"([.!?]+[\"')\]*]*)\s+[\"'(\[*]*(\S)")
+# Words that end in a period without ending the sentence
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "fig", "gen", "gov", "inc", "ltd"}
+
+class SentenceLimit:
+    # Counts sentences across streamed tokens, rescanning only the text after the last candidate. A break only
+    # counts once the next sentence has visibly started with a capital letter, so "e.g. ", "Dr. Smith",
+    # "U.S. " and list markers such as "1. " do not use up the limit
+    def __init__(self, max_sentences):
+        self.max_sentences = max_sentences
+        self.text = ""
+        self.sentences = 0
+        self.scan_from = 0
+
+    def clip(self, token):
+        # Returns the part of the token to keep, and whether the reply is complete with it
+        start = len(self.text)
+        self.text += token
+        for match in SENTENCE_END.finditer(self.text, self.scan_from):
+            self.scan_from = match.end(1)
+            if not self.ends_sentence(match):
+                continue
+            self.sentences += 1
+            if self.sentences >= self.max_sentences:
+                return self.text[start:max(match.end(1), start)], True
+        return token, False
+
+    def ends_sentence(self, match):
+        if not match.group(2).isupper():
+            return False
+        if not match.group(1).startswith('.'):
+            return True
+        preceding = self.text[max(match.start() - 12, 0):match.start()].split()
+        word = preceding[-1].lstrip("\"'([*") if preceding else ""
+        # A number only marks a list item when it is all that comes before it on its line
+        line_start = self.text.rfind('\n', 0, match.start()) + 1
+        list_marker = word.isdigit() and self.text[line_start:match.start()].strip() == word
+        # Initials (but not "I"), dotted abbreviations, list markers and common titles
+        initial = len(word) == 1 and word.isupper() and word != "I"
+        return not (initial or '.' in word or list_marker or word.lower() in ABBREVIATIONS)
+
 class Participant:
-    def __init__(self, model, profile, topic, name, ollama_host):
+    # Prompt, history and turn bookkeeping; the requests themselves are made by AsyncParticipant
+    def __init__(self, model, profile, topic, name, ollama_host, max_history_messages=None,
+                 history_block_size=1, stable_prompt=False, chat_kwargs=None, token_budget=None, max_sentences=None):
         self.model = model
         self.profile = profile
         self.topic = topic
         self.name = name
-        self.client = ollama.Client(host=ollama_host)
+        self.ollama_host = ollama_host
+        self.system_prompt = {
+            "role": "system",
+            "content": f"You are Participant {self.name.split()[-1]} in a conversation about {self.topic}. "
+                       f"Your profile: {self.profile}. "
+                       "Keep your responses concise (2-3 sentences max). "
+                       "Act naturally, you can change the topic, argue, or debate as you see fit. "
+                       "This is a free-flowing conversation."
+        }
+        # A stable prompt only appends to the end between turns so Ollama can reuse its prompt cache;
+        # the standing instruction lives in the system prompt instead of being re-added after every turn
+        self.stable_prompt = stable_prompt
+        if stable_prompt:
+            self.system_prompt["content"] += " When it is your turn, reply with your next message in the conversation."
+        # Extra arguments for client.chat, such as keep_alive and options
+        self.chat_kwargs = chat_kwargs or {}
+        # Replies are streamed and cut off after this many sentences, closing the request so Ollama stops generating
+        self.max_sentences = max_sentences
+        # This participant's view of the transcript, already converted to API messages and
+        # bounded so the whole prompt, including the system prompt and turn instruction, fits token_budget
+        tokenizer = get_tokenizer(model)
+        max_history_tokens = None
+        if token_budget is not None:
+            reserved = tokenizer(self.system_prompt["content"]) + tokenizer(FINAL_ROUND_PROMPT)
+            max_history_tokens = max(token_budget - reserved, 0)
+        self.history = HistoryWindow(max_history_messages, history_block_size, max_history_tokens, tokenizer)
+        self.last_response = None
+        self.last_error = None
+        self.last_turn_stats = {}
         logger.info(f"Initialized {self.name} with model {self.model}")
 
-    def generate_response(self, conversation_history, is_final_round=False):
-        messages = [
-            {
-                "role": "system",
-                "content": f"You are Participant {self.name.split()[-1]} in a conversation about {self.topic}. "
-                           f"Your profile: {self.profile}. "
-                           "Keep your responses concise (2-3 sentences max). "
-                           "Act naturally, you can change the topic, argue, or debate as you see fit. "
-                           "This is a free-flowing conversation."
-            }
-        ]
-
-        # Convert conversation history to API-compatible format
-        for msg in conversation_history:
-            if msg['role'] == 'system':
-                messages.append(msg)
-            elif msg['role'] == self.name:
-                # This is the participant's own previous message
-                messages.append({"role": "assistant", "content": msg['content']})
-            else:
-                # This is a message from other participants
-                messages.append({"role": "user", "content": f"{msg['role']}: {msg['content']}"})
+    def observe(self, msg):
+        # Convert each transcript entry once, when it is added to the conversation
+        if msg.get('status') == 'failed':
+            # A failed turn has no content for the other participants to respond to
+            return
+        if msg['role'] == 'system':
+            self.history.append(msg, system=True)
+        elif msg['role'] == self.name:
+            # This is the participant's own previous message
+            self.history.append({"role": "assistant", "content": msg['content']})
+        else:
+            # This is a message from other participants
+            self.history.append({"role": "user", "content": f"{msg['role']}: {msg['content']}"})
+
+    def set_summary(self, summary):
+        self.history.set_summary({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+
+    def build_messages(self, is_final_round=False):
+        messages = [self.system_prompt]
+        messages.extend(self.history)
 
         # Add the final round prompt if necessary
         if is_final_round:
             messages.append({
                 "role": "user",
-                "content": "This is your final turn in the conversation. Please share your concluding thoughts or final comments."
+                "content": FINAL_ROUND_PROMPT
             })
-        else:
+        elif not self.stable_prompt:
             messages.append({
                 "role": "user",
-                "content": "Please provide your next response in the conversation."
+                "content": NEXT_TURN_PROMPT
             })
 
-        logger.debug(f"Generating response for {self.name}. Messages: {messages}")
+        return messages
+
+    def _start_turn(self, is_final_round):
+        messages = self.build_messages(is_final_round)
+        logger.debug("Generating response for %s. Messages: %s", self.name, Truncated(messages))
+        self.last_response = None
+        self.last_error = None
+        self.last_turn_stats = {}
+        self.cache_key, cached = response_cache.lookup(self.model, messages, self.chat_kwargs.get('options'))
+        return messages, cached
+
+    def _finish_cached(self, response):
+        # Replayed from the response cache: no tokens were generated for this turn
+        logger.info("%s response served from cache", self.name)
+        now = time.perf_counter()
+        self.last_turn_stats = dict(self._turn_stats({}, now, now, now), cached=True)
+        self.last_response = response['message']['content']
+        return self.last_response
+
+    def _finish_response(self, response, start_time):
+        logger.debug("Received response from Ollama for %s: %s", self.name, Truncated(response))
+
+        if 'message' not in response:
+            return self._failed_response(f"unexpected response structure: {response}")
+
+        content = response['message'].get('content', '').strip()
+        self.last_turn_stats = self._turn_stats(response, start_time, None, time.perf_counter())
+
+        if not content:
+            return self._failed_response(f"empty response: {response}")
+
+        logger.info("%s generated response: %s", self.name, Truncated(content))
+        response_cache.store(self.cache_key, self.model, response)
+        self.last_response = content
+        return content
+
+    def _finish_stream(self, chunks, final_chunk, start_time, first_token_time, cut=False):
+        if 'eval_count' not in final_chunk:
+            final_chunk = dict(final_chunk, eval_count=len(chunks))
+        self.last_turn_stats = self._turn_stats(final_chunk, start_time, first_token_time, time.perf_counter())
+        if cut:
+            # Without the cut the reply could have run on to num_predict tokens
+            num_predict = (self.chat_kwargs.get('options') or {}).get('num_predict') or 0
+            self.last_turn_stats.update(cut=True, tokens_saved=max(num_predict - final_chunk['eval_count'], 0))
+            logger.info("%s reply cut off after %d sentences", self.name, self.max_sentences)
+
+        content = ''.join(chunks).strip()
+        if not content:
+            return self._failed_response(f"empty response: {final_chunk}")
+
+        logger.info("%s generated response: %s", self.name, Truncated(content))
+        response_cache.store(self.cache_key, self.model, dict(final_chunk, message={"role": "assistant", "content": content}))
+        self.last_response = content
+        return content
+
+    def _failed_response(self, error):
+        # The turn is marked as failed instead of being stored with placeholder content
+        logger.error("Error generating response for %s: %s", self.name, Truncated(error))
+        self.last_response = None
+        self.last_error = str(error)
+        return None
+
+    def _turn_stats(self, response, start_time, first_token_time, end_time):
+        stats = {
+            "participant": self.name,
+            "model": self.model,
+            "host": self.ollama_host,
+            "duration": end_time - start_time,
+            "ttft": (first_token_time or end_time) - start_time,
+            **response_timings(response),
+        }
+        # Prefer the server-side timing, fall back to wall-clock time after the first token
+        eval_duration = stats["eval_duration"]
+        if not eval_duration:
+            eval_duration = end_time - (first_token_time or start_time)
+        stats["tokens_per_sec"] = stats["eval_count"] / eval_duration if eval_duration > 0 else 0.0
+        logger.info("%s turn stats: TTFT %.2fs, %.1f tokens/sec, %s prompt tokens evaluated in %.2fs", self.name,
+                    stats['ttft'], stats['tokens_per_sec'], stats['prompt_eval_count'], stats['prompt_eval_duration'])
+        return stats
+
+class AsyncParticipant(Participant):
+    def __init__(self, *args, router=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # With a router the host is chosen per request instead of fixed at creation
+        self.router = router
+
+    @property
+    def client(self):
+        # Clients are shared per host (and event loop) through the registry rather than owned by each participant
+        return get_async_client(self.ollama_host)
+
+    @asynccontextmanager
+    async def route(self):
+        if self.router is None:
+            yield self.ollama_host
+            return
+        async with self.router.acquire(self.model) as host:
+            self.ollama_host = host
+            yield host
+
+    async def generate_response(self, is_final_round=False):
+        if self.max_sentences:
+            async for _ in self.stream_response(is_final_round):
+                pass
+            return self.last_response
+        messages, cached = self._start_turn(is_final_round)
+        if cached:
+            return self._finish_cached(cached)
+
+        try:
+            async with self.route():
+                logger.info("Sending request to Ollama for %s using model %s", self.name, self.model)
+                start_time = time.perf_counter()
+                response = await get_policy().call_async(
+                    self.ollama_host, lambda: self.client.chat(model=self.model, messages=messages, **self.chat_kwargs), self.name)
+        except Exception as e:
+            return self._failed_response(e)
+        return self._finish_response(response, start_time)
+
+    async def stream_response(self, is_final_round=False):
+        messages, cached = self._start_turn(is_final_round)
+        if cached:
+            yield cached['message']['content']
+            self._finish_cached(cached)
+            return
+        chunks = []
+        final_chunk = {}
+        first_token_time = None
+        limit = SentenceLimit(self.max_sentences) if self.max_sentences else None
+        cut = False
 
         try:
-            logger.info(f"Sending request to Ollama for {self.name} using model {self.model}")
-            response = self.client.chat(model=self.model, messages=messages)
-            logger.info(f"Received response from Ollama for {self.name}: {response}")
-            
-            if 'message' not in response:
-                logger.error(f"Unexpected response structure for {self.name}: {response}")
-                return f"{self.name} received an unexpected response structure."
-            
-            content = response['message'].get('content', '').strip()
-            
-            if not content:
-                logger.warning(f"{self.name} generated an empty response. Full response: {response}")
-                return f"{self.name} is pondering silently."
-            
-            logger.info(f"{self.name} generated response: {content}")
-            return content
+            async with self.route():
+                logger.info("Sending streaming request to Ollama for %s using model %s", self.name, self.model)
+                start_time = time.perf_counter()
+                response_stream = get_policy().stream_async(
+                    self.ollama_host, lambda: self.client.chat(model=self.model, messages=messages, stream=True, **self.chat_kwargs), self.name)
+                async for chunk in response_stream:
+                    token = chunk.get('message', {}).get('content', '')
+                    if token and limit:
+                        token, cut = limit.clip(token)
+                    if token:
+                        if first_token_time is None:
+                            first_token_time = time.perf_counter()
+                        chunks.append(token)
+                        yield token
+                    if cut:
+                        # Closing the stream drops the connection, which stops the generation on the server
+                        await response_stream.aclose()
+                        break
+                    if chunk.get('done'):
+                        final_chunk = chunk
         except Exception as e:
-            logger.error(f"Error generating response for {self.name}: {e}", exc_info=True)
-            return f"{self.name} is unable to respond at the moment due to a technical issue: {str(e)}"
\ No newline at end of file
+            self._failed_response(e)
+            return
+        self._finish_stream(chunks, final_chunk, start_time, first_token_time, cut)
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    # Content-addressed SQLite cache of chat responses keyed on (model, messages, options).
+    # Only deterministic requests are cached: temperature 0 or a fixed seed.
+    def __init__(self, path, max_entries=10000, max_bytes=None):
+        self.path = os.path.expanduser(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, last_access REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.db.commit()
+        logger.info(f"Response cache opened at {self.path}")
+
+    @staticmethod
+    def is_cacheable(options):
+        options = options or {}
+        return options.get('temperature') == 0 or options.get('seed') is not None
+
+    @staticmethod
+    def make_key(model, messages, options):
+        payload = json.dumps({"model": model, "messages": messages, "options": options or {}},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+        return json.loads(row[0])
+
+    def put(self, key, model, response):
+        data = json.dumps(response, ensure_ascii=False)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, model, data, len(data), time.time())
+            )
+            self.evict()
+            self.db.commit()
+
+    def evict(self):
+        # Least recently used entries go first, until both the entry and size limits hold
+        if self.max_entries is not None:
+            self.db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+        if self.max_bytes is not None:
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        logger.info(f"Response cache stats: {self.stats()}")
+        self.db.close()
+
+_cache = None
+
+def configure_cache(config):
+    global _cache
+    settings = config.get('response_cache') or {}
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+    if settings.get('enabled'):
+        _cache = ResponseCache(settings.get('path', '~/.cache/convollama/responses.sqlite'),
+                               settings.get('max_entries', 10000), settings.get('max_bytes'))
+    return _cache
+
+def get_cache():
+    return _cache
+
+def lookup(model, messages, options):
+    # Returns (key, cached response); key is None when the request is not cacheable
+    if _cache is None or not ResponseCache.is_cacheable(options):
+        return None, None
+    key = ResponseCache.make_key(model, messages, options)
+    return key, _cache.get(key)
+
+def store(key, model, response):
+    if _cache is not None and key is not None:
+        _cache.put(key, model, response)
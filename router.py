@@ -0,0 +1,93 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from ollama_clients import get_async_client
+from warmup import tagged_name
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+class HostState:
+    def __init__(self, host):
+        self.host = host
+        self.in_flight = 0
+        self.latency = None
+        # Tagged names as /api/ps reports them, e.g. "llama3.1:latest"
+        self.loaded_models = set()
+        self.healthy = True
+
+class HostRouter:
+    # Picks an Ollama host per request: fewest requests in flight weighted by observed latency,
+    # preferring hosts that already have the model loaded so a request does not wait for a cold load
+    def __init__(self, hosts, cold_load_penalty=10.0, latency_alpha=0.3, refresh_interval=30.0):
+        self.hosts = {host: HostState(host) for host in hosts}
+        self.cold_load_penalty = cold_load_penalty
+        self.latency_alpha = latency_alpha
+        self.refresh_interval = refresh_interval
+        self.last_refresh = 0.0
+        self.refresh_task = None
+
+    async def refresh_loaded_models(self):
+        async def refresh(state):
+            try:
+                response = await get_async_client(state.host).ps()
+                state.loaded_models = {tagged_name(model['name']) for model in response.get('models', [])}
+                state.healthy = True
+            except Exception as e:
+                logger.warning(f"Could not list loaded models on {state.host}: {e}")
+                state.healthy = False
+
+        self.last_refresh = time.monotonic()
+        await asyncio.gather(*(refresh(state) for state in self.hosts.values()))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Loaded models per host: %s", {h: sorted(s.loaded_models) for h, s in self.hosts.items()})
+
+    def maybe_refresh(self):
+        if time.monotonic() - self.last_refresh < self.refresh_interval:
+            return
+        if self.refresh_task is None or self.refresh_task.done():
+            self.last_refresh = time.monotonic()
+            self.refresh_task = asyncio.create_task(self.refresh_loaded_models())
+
+    def score(self, state, model):
+        latency = state.latency if state.latency is not None else 1.0
+        score = (state.in_flight + 1) * latency
+        if tagged_name(model) not in state.loaded_models:
+            score += self.cold_load_penalty
+        if not state.healthy:
+            score += self.cold_load_penalty * 10
+        return score
+
+    def choose(self, model):
+        return min(self.hosts.values(), key=lambda state: self.score(state, model)).host
+
+    @asynccontextmanager
+    async def acquire(self, model):
+        self.maybe_refresh()
+        state = self.hosts[self.choose(model)]
+        state.in_flight += 1
+        start_time = time.perf_counter()
+        succeeded = False
+        try:
+            yield state.host
+            succeeded = True
+        finally:
+            state.in_flight -= 1
+            if succeeded:
+                elapsed = time.perf_counter() - start_time
+                state.latency = elapsed if state.latency is None else \
+                    self.latency_alpha * elapsed + (1 - self.latency_alpha) * state.latency
+                state.loaded_models.add(tagged_name(model))
+
+_routers = {}
+
+def get_router(hosts, config=None):
+    # One router per set of hosts, shared by every conversation in the process
+    key = tuple(hosts)
+    router = _routers.get(key)
+    if router is None:
+        settings = (config or {}).get('routing') or {}
+        router = _routers[key] = HostRouter(hosts, settings.get('cold_load_penalty', 10.0),
+                                            settings.get('latency_alpha', 0.3), settings.get('refresh_interval', 30.0))
+    return router
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from call_policy import CallPolicy, CircuitOpenError
+
+HOST = "http://ollama.test"
+
+def refused():
+    raise ConnectionError("refused")
+
+def open_circuit(policy):
+    # One transient failure opens the circuit with failure_threshold=1
+    with pytest.raises(ConnectionError):
+        policy.call(HOST, refused)
+    assert policy.breaker(HOST).opened_at is not None
+
+def chunks():
+    yield from ("One.", " Two.", " Three.")
+
+async def async_chunks():
+    for chunk in chunks():
+        yield chunk
+
+async def async_request():
+    return async_chunks()
+
+def read_first_chunk(policy):
+    # Reads one chunk, then closes the stream the way a reader at its sentence limit does
+    async def read():
+        stream = policy.stream_async(HOST, async_request)
+        async for chunk in stream:
+            await stream.aclose()
+            return chunk
+    return asyncio.run(read())
+
+def test_cut_streams_reset_the_failure_count():
+    policy = CallPolicy(max_attempts=1, failure_threshold=2, reset_timeout=60)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            policy.call(HOST, refused)
+        assert policy.breaker(HOST).failures == 1
+        assert read_first_chunk(policy) == "One."
+        assert policy.breaker(HOST).failures == 0
+    # Scattered failures between successful cut streams never open the circuit
+    assert policy.breaker(HOST).allow()
+
+def test_cut_stream_probe_closes_the_circuit():
+    policy = CallPolicy(max_attempts=1, failure_threshold=1, reset_timeout=0)
+    open_circuit(policy)
+
+    assert read_first_chunk(policy) == "One."
+
+    breaker = policy.breaker(HOST)
+    assert breaker.opened_at is None
+    assert not breaker.probing
+    assert breaker.allow()
+
+def test_cancelled_probe_lets_the_next_request_probe():
+    policy = CallPolicy(max_attempts=1, failure_threshold=1, reset_timeout=0)
+    open_circuit(policy)
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(policy.call_async(HOST, lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert policy.breaker(HOST).allow()
+
+def test_open_circuit_fails_fast():
+    policy = CallPolicy(max_attempts=1, failure_threshold=1, reset_timeout=60)
+    open_circuit(policy)
+    with pytest.raises(CircuitOpenError):
+        policy.call(HOST, lambda: "reply")
@@ -0,0 +1,70 @@
+import gc
+import os
+
+import pytest
+
+from history_store import HistoryStore
+from transcript import TranscriptWriter
+
+TOPIC = {"role": "system", "content": "Topic: tides"}
+SUMMARY = {"role": "system", "content": "Summary after turn 3"}
+
+def turn(i):
+    return {"role": f"Participant {i % 2 + 1}", "content": f"Turn {i}"}
+
+def conversation(turns=6, summary_at=3):
+    # The topic comes first and a system summary is inserted after `summary_at` turns
+    entries = [TOPIC]
+    for i in range(turns):
+        if i == summary_at:
+            entries.append(SUMMARY)
+        entries.append(turn(i))
+    return entries
+
+def fill(store, entries, writer=None):
+    for entry in entries:
+        if writer is not None:
+            writer.write(entry)
+        store.append(entry)
+    return store
+
+@pytest.fixture
+def transcript(tmp_path):
+    writer = TranscriptWriter(str(tmp_path / "convo.jsonl"), {"topic": "tides"})
+    yield writer
+    writer.close()
+
+def test_spills_older_turns_to_a_temporary_file():
+    store = fill(HistoryStore(resident=2), conversation())
+    assert store.spilled == 4
+    assert len(store.recent_turns) == 2
+    assert list(store) == conversation()
+    assert len(store) == 8
+
+    spill_path = store.spill_file.name
+    assert os.path.exists(spill_path)
+    del store
+    gc.collect()
+    assert not os.path.exists(spill_path)
+
+def test_reads_spilled_turns_back_from_the_transcript(transcript):
+    store = fill(HistoryStore(resident=2, transcript_path=transcript.path), conversation(), transcript)
+    assert store.spilled == 4
+    # Nothing is written twice: the transcript already has every entry
+    assert store.spill_file is None
+    assert list(store) == conversation()
+    assert store.recent(3) == [turn(3), turn(4), turn(5)]
+
+def test_system_entries_keep_their_place_when_iterated():
+    entries = conversation(turns=4, summary_at=4) + [{"role": "system", "content": "Closing note"}]
+    assert list(fill(HistoryStore(resident=1), entries)) == entries
+
+@pytest.mark.parametrize("count, expected", [
+    # The summary comes before the first turn shown, so it goes to the top with the topic
+    (2, [TOPIC, SUMMARY, turn(4), turn(5)]),
+    # The summary comes after the first turn shown, so it stays in its place
+    (4, [TOPIC, turn(2), SUMMARY, turn(3), turn(4), turn(5)]),
+    (None, conversation()),
+])
+def test_tail_places_system_entries(count, expected):
+    assert fill(HistoryStore(resident=2), conversation()).tail(count) == expected
@@ -0,0 +1,57 @@
+import pytest
+
+from participant import SentenceLimit
+
+def clip_all(tokens, max_sentences):
+    # Feeds the tokens the way a stream does; like _finish_stream, the kept text is stripped
+    limit = SentenceLimit(max_sentences)
+    kept = []
+    for token in tokens:
+        token, cut = limit.clip(token)
+        kept.append(token)
+        if cut:
+            return "".join(kept).strip(), True
+    return "".join(kept).strip(), False
+
+def words(text):
+    return [word + " " for word in text.split(" ")]
+
+def test_cuts_after_the_limit_within_one_token():
+    assert clip_all(["One. Two. Three. Four."], 2) == ("One. Two.", True)
+
+def test_cuts_when_the_break_spans_tokens():
+    # The terminator, the space and the next capital all arrive in different tokens
+    assert clip_all(["One", ".", " ", "Two", ".", " ", "Three", " more."], 2) == ("One. Two.", True)
+
+def test_drops_the_start_of_the_next_sentence():
+    assert clip_all(["One.", " Two", " words."], 1) == ("One.", True)
+
+def test_keeps_closing_quotes_and_brackets():
+    assert clip_all(['He said "stop."', ' Then (it ended!)', ' Next'], 2) == ('He said "stop." Then (it ended!)', True)
+
+def test_question_and_exclamation_marks_end_sentences():
+    assert clip_all(["Really?", " Yes!", " Fine"], 2) == ("Really? Yes!", True)
+
+def test_a_break_needs_the_next_sentence_to_start():
+    # Without a following capital letter the reply may still be mid-sentence
+    assert clip_all(["One. Two.", " "], 2) == ("One. Two.", False)
+
+@pytest.mark.parametrize("text, first_sentence", [
+    ("See e.g. the other case. Then more.", "See e.g. the other case."),
+    ("Ask Dr. Smith about it. Then more.", "Ask Dr. Smith about it."),
+    ("The U.S. Senate voted today. Then more.", "The U.S. Senate voted today."),
+    ("Consider:\n1. Cost matters here. Then more.", "Consider:\n1. Cost matters here."),
+    ("It was J. Doe who said it. Then more.", "It was J. Doe who said it."),
+    ("A lower case break. ok, then. Then more.", "A lower case break. ok, then."),
+])
+def test_abbreviations_and_list_markers_do_not_count(text, first_sentence):
+    assert clip_all(words(text), 1) == (first_sentence, True)
+
+@pytest.mark.parametrize("text, first_sentence", [
+    ("My answer is no. We should stop.", "My answer is no."),
+    ("So do I. We agree.", "So do I."),
+    ("It costs 5. Next year it costs more.", "It costs 5."),
+    ("Steps:\n  2. Then 3. Done.", "Steps:\n  2. Then 3."),
+])
+def test_words_that_look_like_abbreviations_can_end_a_sentence(text, first_sentence):
+    assert clip_all(words(text), 1) == (first_sentence, True)
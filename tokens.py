@@ -0,0 +1,36 @@
+from functools import lru_cache
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Tokens added per chat message for role markers and separators
+MESSAGE_OVERHEAD = 4
+
+_tokenizers = {}
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text with common BPE vocabularies
+    return (len(text) + 3) // 4 + MESSAGE_OVERHEAD
+
+def register_tokenizer(model_prefix, tokenizer):
+    # tokenizer(text) -> token count, used for every model whose name starts with model_prefix
+    _tokenizers[model_prefix] = tokenizer
+    get_tokenizer.cache_clear()
+    logger.info(f"Registered tokenizer for models matching '{model_prefix}'")
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model):
+    matches = [prefix for prefix in _tokenizers if model.startswith(prefix)]
+    if not matches:
+        return estimate_tokens
+    return _tokenizers[max(matches, key=len)]
+
+def get_token_budget(config):
+    # Explicit budget first, otherwise what is left of num_ctx after room for the reply
+    if config.get('context_token_budget'):
+        return int(config['context_token_budget'])
+    options = config.get('options') or {}
+    if options.get('num_ctx'):
+        return int(options['num_ctx']) - int(options.get('num_predict') or 512)
+    return None
@@ -0,0 +1,95 @@
+import json
+import os
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+class TranscriptWriter:
+    # Append-only JSONL transcript: a header line with the conversation settings, then one line per entry,
+    # flushed as soon as it is written so a crash loses at most the turn in progress
+    def __init__(self, path, metadata, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not is_new:
+            truncate_partial_line(path)
+        self.file = open(path, 'a', encoding='utf-8')
+        if is_new:
+            self._write_line(dict(metadata, type="header"))
+        logger.info(f"Writing transcript to {path}")
+
+    def write(self, entry):
+        self._write_line(entry)
+
+    def _write_line(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+def truncate_partial_line(path):
+    # Drop a final line left half-written by a crash so appended entries start on a fresh line
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position = end
+        while position > 0:
+            step = min(4096, position)
+            f.seek(position - step)
+            block = f.read(step)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position != end:
+            logger.warning(f"Discarding {end - position} bytes of an incomplete line at the end of {path}")
+            f.truncate(position)
+
+def iter_transcript(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written final line is expected after a crash
+                logger.warning(f"Skipping unreadable line {line_num} in {path}")
+
+def iter_entries(path):
+    return (record for record in iter_transcript(path) if record.get('type') != 'header')
+
+def load_transcript(path):
+    metadata = None
+    entries = []
+    for record in iter_transcript(path):
+        if record.get('type') == 'header':
+            metadata = record
+        else:
+            entries.append(record)
+    if metadata is None:
+        raise ValueError(f"Transcript {path} has no header line")
+    logger.info(f"Loaded {len(entries)} entries from {path}")
+    return metadata, entries
+
+def export_json(jsonl_path, json_path):
+    with open(json_path, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for i, entry in enumerate(iter_entries(jsonl_path)):
+            f.write(",\n  " if i else "\n  ")
+            f.write(json.dumps(entry, ensure_ascii=False))
+        f.write("\n]\n")
+
+def export_markdown(jsonl_path, md_path):
+    with open(md_path, 'w', encoding='utf-8') as f:
+        for i, entry in enumerate(iter_entries(jsonl_path)):
+            if i == 0:
+                f.write(f"# Conversation: {entry['content']}\n\n")
+            elif entry.get('status') != 'failed':
+                f.write(f"## {entry['role']}\n\n{entry['content']}\n\n")
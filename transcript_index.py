@@ -0,0 +1,276 @@
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE, topic TEXT, model TEXT, created TEXT,
+    num_participants INTEGER, num_rounds INTEGER, mtime REAL, size INTEGER, offset INTEGER, turns INTEGER
+);
+CREATE TABLE IF NOT EXISTS participants (
+    conversation_id INTEGER, name TEXT, model TEXT, profile TEXT
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY, conversation_id INTEGER, turn INTEGER, role TEXT, model TEXT, status TEXT, length INTEGER
+);
+CREATE INDEX IF NOT EXISTS turns_conversation ON turns (conversation_id);
+CREATE INDEX IF NOT EXISTS turns_model ON turns (model, status);
+CREATE INDEX IF NOT EXISTS participants_conversation ON participants (conversation_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS turn_search USING fts5(content, tokenize='porter unicode61');
+CREATE VIRTUAL TABLE IF NOT EXISTS conversation_search USING fts5(topic, profiles, tokenize='porter unicode61');
+CREATE TABLE IF NOT EXISTS skipped (path TEXT PRIMARY KEY, mtime REAL, size INTEGER);
+"""
+
+# Replies that older versions stored in place of a failed turn
+FAILURE_PLACEHOLDERS = re.compile(
+    r"is unable to respond at the moment due to a technical issue|is pondering silently\.$"
+    r"|received an unexpected response structure\.$"
+)
+
+def turn_status(entry):
+    if entry.get('status') == 'failed' or FAILURE_PLACEHOLDERS.search(entry.get('content') or ""):
+        return 'failed'
+    return 'ok'
+
+class TranscriptIndex:
+    # SQLite FTS5 index over the transcripts in save_path. .jsonl transcripts are append-only, so a file
+    # that grew since the last update is indexed from where the previous update stopped
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, save_path):
+        start_time = time.perf_counter()
+        paths = sorted(glob.glob(os.path.join(save_path, "*.jsonl")))
+        transcripts = {os.path.splitext(path)[0] for path in paths}
+        # .json files are only indexed when they are not an export of a .jsonl transcript
+        paths += [path for path in sorted(glob.glob(os.path.join(save_path, "*.json")))
+                  if os.path.splitext(path)[0] not in transcripts]
+
+        known = {row[0]: row[1:] for row in self.db.execute("SELECT path, id, mtime, size, offset FROM conversations")}
+        # Files in save_path that are not transcripts, such as metrics exports, are only read again once they change
+        skipped = {row[0]: row[1:] for row in self.db.execute("SELECT path, mtime, size FROM skipped")}
+        counts = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0, "skipped": 0}
+        with self.db:
+            for path in paths:
+                stat = os.stat(path)
+                if skipped.pop(path, None) == (stat.st_mtime, stat.st_size):
+                    counts["skipped"] += 1
+                    continue
+                previous = known.pop(path, None)
+                if previous and previous[1] == stat.st_mtime and previous[2] == stat.st_size:
+                    counts["unchanged"] += 1
+                    continue
+                if previous and path.endswith(".jsonl") and stat.st_size > previous[3] > 0:
+                    self.index_jsonl(path, stat, previous[0], previous[3])
+                    counts["updated"] += 1
+                    continue
+                if previous:
+                    self.remove(previous[0])
+                indexed = self.index_jsonl(path, stat) if path.endswith(".jsonl") else self.index_json(path, stat)
+                if indexed:
+                    self.db.execute("DELETE FROM skipped WHERE path = ?", (path,))
+                    counts["updated" if previous else "added"] += 1
+                else:
+                    self.db.execute("INSERT OR REPLACE INTO skipped (path, mtime, size) VALUES (?, ?, ?)",
+                                    (path, stat.st_mtime, stat.st_size))
+                    counts["skipped"] += 1
+            for path, (conversation_id, *_) in known.items():
+                self.remove(conversation_id)
+                counts["removed"] += 1
+            self.db.executemany("DELETE FROM skipped WHERE path = ?", [(path,) for path in skipped])
+        counts["elapsed"] = time.perf_counter() - start_time
+        logger.info(f"Index update: {counts}")
+        return counts
+
+    def remove(self, conversation_id):
+        self.db.execute("DELETE FROM turn_search WHERE rowid IN (SELECT id FROM turns WHERE conversation_id = ?)",
+                        (conversation_id,))
+        self.db.execute("DELETE FROM turns WHERE conversation_id = ?", (conversation_id,))
+        self.db.execute("DELETE FROM participants WHERE conversation_id = ?", (conversation_id,))
+        self.db.execute("DELETE FROM conversation_search WHERE rowid = ?", (conversation_id,))
+        self.db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def add_conversation(self, path, stat, header):
+        profiles = header.get('profiles') or []
+        models = header.get('participant_models') or [header.get('model')] * len(profiles)
+        cursor = self.db.execute(
+            "INSERT INTO conversations (path, topic, model, created, num_participants, num_rounds, mtime, size, offset, turns) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, 0)",
+            (path, header.get('topic'), header.get('model'), header.get('created'), header.get('num_participants'),
+             header.get('num_rounds'), stat.st_mtime, stat.st_size)
+        )
+        conversation_id = cursor.lastrowid
+        self.db.executemany(
+            "INSERT INTO participants (conversation_id, name, model, profile) VALUES (?, ?, ?, ?)",
+            [(conversation_id, f"Participant {i + 1}", models[i] if i < len(models) else None, profile)
+             for i, profile in enumerate(profiles)]
+        )
+        self.db.execute("INSERT INTO conversation_search (rowid, topic, profiles) VALUES (?, ?, ?)",
+                        (conversation_id, header.get('topic') or "", "\n".join(p for p in profiles if p)))
+        return conversation_id
+
+    def add_turns(self, conversation_id, entries, first_turn):
+        models = dict(self.db.execute("SELECT name, model FROM participants WHERE conversation_id = ?", (conversation_id,)))
+        turn = first_turn
+        for entry in entries:
+            if entry.get('role') == 'system':
+                continue
+            content = entry.get('content') or ""
+            cursor = self.db.execute(
+                "INSERT INTO turns (conversation_id, turn, role, model, status, length) VALUES (?, ?, ?, ?, ?, ?)",
+                (conversation_id, turn, entry['role'], models.get(entry['role']), turn_status(entry), len(content))
+            )
+            if content:
+                self.db.execute("INSERT INTO turn_search (rowid, content) VALUES (?, ?)", (cursor.lastrowid, content))
+            turn += 1
+        return turn
+
+    def index_jsonl(self, path, stat, conversation_id=None, offset=0):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        # A half-written final line is left for the next update
+        complete = data[:data.rfind(b"\n") + 1]
+        records = []
+        for line in complete.decode('utf-8').splitlines():
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping unreadable line in {path}")
+
+        if conversation_id is None:
+            header = next((record for record in records if record.get('type') == 'header'), None)
+            if header is None:
+                logger.warning(f"Skipping {path}: no header line")
+                return False
+            conversation_id = self.add_conversation(path, stat, header)
+        first_turn = self.db.execute("SELECT turns FROM conversations WHERE id = ?", (conversation_id,)).fetchone()[0]
+        turns = self.add_turns(conversation_id, [r for r in records if r.get('type') != 'header'], first_turn)
+        self.db.execute("UPDATE conversations SET mtime = ?, size = ?, offset = ?, turns = ? WHERE id = ?",
+                        (stat.st_mtime, stat.st_size, offset + len(complete), turns, conversation_id))
+        return True
+
+    def index_json(self, path, stat):
+        # Conversations saved before transcripts were written as JSONL: a list of entries, topic first
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logger.warning(f"Skipping {path}: {e}")
+            return False
+        if not isinstance(entries, list) or not entries or not all(isinstance(entry, dict) and 'role' in entry for entry in entries):
+            return False
+        topic = entries[0].get('content', "")
+        profiles = [entry['content'].split(" profile: ", 1)[1] for entry in entries
+                    if entry.get('role') == 'system' and " profile: " in entry.get('content', "")]
+        header = {"topic": topic[len("Topic: "):] if topic.startswith("Topic: ") else topic, "profiles": profiles}
+        conversation_id = self.add_conversation(path, stat, header)
+        turns = self.add_turns(conversation_id, entries, 0)
+        self.db.execute("UPDATE conversations SET turns = ? WHERE id = ?", (turns, conversation_id))
+        return True
+
+    def search(self, query, model=None, role=None, limit=20):
+        sql = ("SELECT c.path, c.topic, t.turn, t.role, t.model, snippet(turn_search, 0, '[', ']', '...', 12) "
+               "FROM turn_search JOIN turns t ON t.id = turn_search.rowid JOIN conversations c ON c.id = t.conversation_id "
+               "WHERE turn_search MATCH ?")
+        params = [query]
+        if model:
+            sql += " AND t.model = ?"
+            params.append(model)
+        if role:
+            sql += " AND t.role = ?"
+            params.append(role)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        return self.db.execute(sql, params).fetchall()
+
+    def search_conversations(self, query, model=None, limit=20):
+        sql = ("SELECT c.path, c.topic, c.model, c.turns, snippet(conversation_search, -1, '[', ']', '...', 12) "
+               "FROM conversation_search JOIN conversations c ON c.id = conversation_search.rowid "
+               "WHERE conversation_search MATCH ?")
+        params = [query]
+        if model:
+            sql += " AND c.id IN (SELECT conversation_id FROM participants WHERE model = ?)"
+            params.append(model)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        return self.db.execute(sql, params).fetchall()
+
+    def stats(self):
+        return self.db.execute(
+            "SELECT COALESCE(model, '(unknown)'), COUNT(DISTINCT conversation_id), COUNT(*), "
+            "AVG(CASE WHEN status = 'ok' THEN length END), SUM(status = 'failed') "
+            "FROM turns GROUP BY model ORDER BY COUNT(*) DESC"
+        ).fetchall()
+
+def default_paths(args):
+    save_path = args.save_path
+    if save_path is None:
+        from config import load_config
+        save_path = load_config(args.config)['save_path']
+    save_path = os.path.expanduser(save_path)
+    return save_path, args.db or os.path.join(save_path, "index.sqlite")
+
+def main():
+    parser = argparse.ArgumentParser(description="Search and summarize saved conversations")
+    parser.add_argument("-c", "--config", default="config.yaml", help="Configuration file to take save_path from")
+    parser.add_argument("--save-path", help="Directory of saved conversations (overrides the config)")
+    parser.add_argument("--db", help="Index file (default: index.sqlite in the save path)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("update", help="Index new and changed transcripts")
+    search = commands.add_parser("search", help="Full-text search over turns, or topics and profiles with --topics")
+    search.add_argument("query", help="FTS5 query, e.g. 'carbon tax', '\"carbon tax\"' or 'NEAR(nuclear cost, 5)'")
+    search.add_argument("--topics", action="store_true", help="Search topics and participant profiles instead of turns")
+    search.add_argument("--model")
+    search.add_argument("--role", help="Only turns by this participant, e.g. 'Participant 2'")
+    search.add_argument("--limit", type=int, default=20)
+    commands.add_parser("stats", help="Turns, reply lengths and failed turns per model")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    save_path, db_path = default_paths(args)
+    index = TranscriptIndex(db_path)
+    try:
+        if args.command != "update":
+            # Queries see the archive as it is now; only changed files are read
+            index.update(save_path)
+        start_time = time.perf_counter()
+        if args.command == "update":
+            counts = index.update(save_path)
+            print(f"{counts['added']} added, {counts['updated']} updated, {counts['removed']} removed, "
+                  f"{counts['unchanged']} unchanged, {counts['skipped']} not transcripts in {counts['elapsed'] * 1000:.0f} ms ({db_path})")
+            return
+        elif args.command == "search" and args.topics:
+            for path, topic, model, turns, snippet in index.search_conversations(args.query, args.model, args.limit):
+                print(f"{os.path.basename(path)}  [{model or '?'}, {turns} turns]  {topic}\n    {snippet}")
+        elif args.command == "search":
+            for path, topic, turn, role, model, snippet in index.search(args.query, args.model, args.role, args.limit):
+                print(f"{os.path.basename(path)} #{turn + 1} {role} ({model or '?'}): {snippet}")
+        else:
+            print(f"{'model':<28} {'convos':>6} {'turns':>7} {'avg chars':>9} {'failed':>6}")
+            for model, conversations, turns, average, failed in index.stats():
+                print(f"{model:<28} {conversations:>6} {turns:>7} {average or 0:>9.0f} {failed:>6}")
+        print(f"({(time.perf_counter() - start_time) * 1000:.1f} ms)", file=sys.stderr)
+    except sqlite3.OperationalError as e:
+        print(f"Query failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,40 @@
 import os
 import json
+import asyncio
 from datetime import datetime
-import ollama
+from functools import lru_cache
+from transcript import export_json, export_markdown
 import sys
 import time
 import threading
 import logging
-from colorama import Fore, Style, init
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-init(autoreset=True)  # Initialize colorama
+@lru_cache(maxsize=None)
+def terminal_colors():
+    # colorama is initialized the first time something is drawn, not when this module is imported
+    from colorama import Fore, Style, init
+    init(autoreset=True)
+    return Fore, Style
 
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
 def check_ollama_connection_with_animation(host, timeout=10):
-    client = ollama.Client(host=host)
+    from ollama_clients import get_client
+    from call_policy import get_policy
+    Fore, Style = terminal_colors()
+    client = get_client(host)
+    policy = get_policy()
     stop_event = threading.Event()
     animation_thread = threading.Thread(target=connection_animation, args=(stop_event,))
     animation_thread.start()
 
     try:
         start_time = time.time()
+        attempt = 0
         while time.time() - start_time < timeout:
             try:
                 client.list()
@@ -33,8 +44,11 @@ def check_ollama_connection_with_animation(host, timeout=10):
                 logger.info(f"{Fore.GREEN}Successfully connected to Ollama server at {host}{Style.RESET_ALL}")
                 return True
             except Exception:
-                time.sleep(0.5)
-        
+                # Back off with jitter instead of polling a server that is starting up at a fixed rate
+                remaining = timeout - (time.time() - start_time)
+                time.sleep(max(min(policy.backoff(attempt), remaining), 0))
+                attempt += 1
+
         stop_event.set()
         animation_thread.join()
         clear_screen()
@@ -49,6 +63,7 @@ def check_ollama_connection_with_animation(host, timeout=10):
 
 def connection_animation(stop_event):
     frames = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
+    Fore, Style = terminal_colors()
     i = 0
     while not stop_event.is_set():
         sys.stdout.write(f"\r{Fore.CYAN}Connecting to Ollama server {frames[i % len(frames)]}{Style.RESET_ALL}")
@@ -56,44 +71,62 @@ def connection_animation(stop_event):
         time.sleep(0.1)
         i += 1
 
-def save_conversation(conversation_history, save_path):
+def new_filename_base():
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"convo_{timestamp}"
+
+def transcript_path(save_path, filename_base):
+    # Expand the user's home directory and create the directory if it doesn't exist
+    expanded_path = os.path.expanduser(save_path)
+    os.makedirs(expanded_path, exist_ok=True)
+    return os.path.join(expanded_path, f"{filename_base}.jsonl")
+
+def save_conversation(conversation_history, save_path, filename_base=None):
     if not conversation_history:
         logger.warning("No conversation history to save.")
         return
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename_base = f"convo_{timestamp}"
+    if filename_base is None:
+        filename_base = new_filename_base()
 
-    # Expand the user's home directory
-    expanded_path = os.path.expanduser(save_path)
+    jsonl_filename = transcript_path(save_path, filename_base)
+    expanded_path = os.path.dirname(jsonl_filename)
+    json_filename = os.path.join(expanded_path, f"{filename_base}.json")
+    md_filename = os.path.join(expanded_path, f"{filename_base}.md")
 
-    # Create the directory if it doesn't exist
-    os.makedirs(expanded_path, exist_ok=True)
+    if os.path.exists(jsonl_filename):
+        # Export from the transcript written during the run instead of serializing the history again
+        export_json(jsonl_filename, json_filename)
+        export_markdown(jsonl_filename, md_filename)
+        logger.info(f"Conversation exported from {jsonl_filename} to {json_filename} and {md_filename}")
+        return
 
-    json_filename = os.path.join(expanded_path, f"{filename_base}.json")
+    entries = list(conversation_history)
     with open(json_filename, 'w') as f:
-        json.dump(conversation_history, f, indent=2)
+        json.dump(entries, f, indent=2)
 
-    md_filename = os.path.join(expanded_path, f"{filename_base}.md")
     with open(md_filename, 'w') as f:
-        f.write(f"# Conversation: {conversation_history[0]['content']}\n\n")
-        for entry in conversation_history[1:]:
+        f.write(f"# Conversation: {entries[0]['content']}\n\n")
+        for entry in entries[1:]:
+            if entry.get('status') == 'failed':
+                continue
             f.write(f"## {entry['role']}\n\n{entry['content']}\n\n")
 
     logger.info(f"Conversation saved to {json_filename} and {md_filename}")
 
-def truncate_context(context, max_length):
-    return context[-max_length:] if len(context) > max_length else context
-
-def animate_thinking(name, stop_event):
+async def animate_thinking_async(name):
+    # Runs until cancelled, sharing the event loop with the request it is waiting on
     frames = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
+    Fore, Style = terminal_colors()
     i = 0
     start_time = time.time()
-    while not stop_event.is_set():
-        elapsed_time = time.time() - start_time
-        sys.stdout.write(f"\r{Fore.YELLOW}{name} is thinking {frames[i % len(frames)]} {elapsed_time:.1f}s{Style.RESET_ALL}")
-        sys.stdout.flush()
-        time.sleep(0.1)
-        i += 1
-    sys.stdout.write("\r" + " " * 80 + "\r")  # Clear the animation
-    sys.stdout.flush()
\ No newline at end of file
+    try:
+        while True:
+            elapsed_time = time.time() - start_time
+            sys.stdout.write(f"\r{Fore.YELLOW}{name} is thinking {frames[i % len(frames)]} {elapsed_time:.1f}s{Style.RESET_ALL}")
+            sys.stdout.flush()
+            await asyncio.sleep(0.1)
+            i += 1
+    finally:
+        sys.stdout.write("\r" + " " * 80 + "\r")  # Clear the animation
+        sys.stdout.flush()
\ No newline at end of file
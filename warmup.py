@@ -0,0 +1,87 @@
+import asyncio
+import time
+from ollama_clients import get_async_client, get_hosts, load_aware_routing
+import metrics
+
+# Configure logging
+import logging
+logger = logging.getLogger(__name__)
+
+def tagged_name(model):
+    # Ollama reports "llama3.1:latest" for a model requested as "llama3.1"
+    return model if ':' in model else f"{model}:latest"
+
+def same_model(loaded, model):
+    return loaded == model or loaded == tagged_name(model)
+
+async def preload(host, model, keep_alive):
+    # An empty generate request makes Ollama load the model without generating anything
+    start_time = time.perf_counter()
+    try:
+        response = await get_async_client(host).generate(model=model, prompt="", keep_alive=keep_alive)
+    except Exception as e:
+        logger.error(f"Failed to preload {model} on {host}: {e}")
+        return {"host": host, "model": model, "load_time": time.perf_counter() - start_time, "error": str(e)}
+    load_time = time.perf_counter() - start_time
+    metrics.record("warmup", model=model, host=host, duration=load_time, **metrics.response_timings(response))
+    logger.info(f"Preloaded {model} on {host} in {load_time:.2f}s")
+    return {"host": host, "model": model, "load_time": load_time, "error": None}
+
+async def check_resident(host, models):
+    # Models that were preloaded but no longer show up in /api/ps were evicted to make room for the others
+    try:
+        response = await get_async_client(host).ps()
+    except Exception as e:
+        logger.warning(f"Could not list loaded models on {host}: {e}")
+        return [], 0
+    loaded = response.get('models', [])
+    missing = [model for model in models if not any(same_model(entry['name'], model) for entry in loaded)]
+    vram = sum(entry.get('size_vram', 0) for entry in loaded)
+    return missing, vram
+
+async def warm_up_async(placement, keep_alive=None):
+    # placement maps each host to the models it will serve
+    start_time = time.perf_counter()
+    loads = await asyncio.gather(*(preload(host, model, keep_alive) for host, models in placement.items() for model in models))
+    residency = await asyncio.gather(*(check_resident(host, models) for host, models in placement.items()))
+
+    evicted = {}
+    for host, (missing, vram) in zip(placement, residency):
+        if missing:
+            evicted[host] = missing
+            logger.warning(f"{', '.join(missing)} did not stay loaded on {host} alongside the other models; "
+                           f"Ollama will swap models between turns")
+        logger.info(f"Models resident on {host} use {vram / 2**30:.1f} GiB of VRAM")
+
+    return {
+        "loads": loads,
+        "evicted": evicted,
+        "elapsed": time.perf_counter() - start_time,
+    }
+
+def model_placement(config, conversations):
+    # The host each model will be served from, given every conversation's list of participant models.
+    # Loading a model anywhere else would only make hosts swap models, and would make every host look
+    # warm to the router
+    hosts = get_hosts(config)
+    placement = {host: [] for host in hosts}
+    if load_aware_routing(config):
+        # The router sends each request to a host that already has its model loaded, so every model
+        # is loaded once, spread over the hosts
+        models = dict.fromkeys(model for participant_models in conversations for model in participant_models)
+        for i, model in enumerate(models):
+            placement[hosts[i % len(hosts)]].append(model)
+    else:
+        # Participants are pinned round-robin, the same way ConversationManager assigns them
+        for participant_models in conversations:
+            for i, model in enumerate(participant_models):
+                placement[hosts[i % len(hosts)]].append(model)
+    # The moderator only talks to ollama_host
+    placement.setdefault(config['ollama_host'], []).append(config['moderator_model'])
+    return {host: list(dict.fromkeys(models)) for host, models in placement.items() if models}
+
+def warm_up(config, placement):
+    if not config.get('warmup', True):
+        return None
+    logger.info("Preloading " + "; ".join(f"{', '.join(models)} on {host}" for host, models in placement.items()))
+    return asyncio.run(warm_up_async(placement, config.get('keep_alive')))